@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fuzzy keyword lookup with the symmetric delete dictionary,
+against computing the edit distance to every known keyword.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import string
+import time
+
+from common import best_of, parse_args, show
+
+from graphdash.search import FuzzyKeywords, edit_distance
+
+LETTERS = string.ascii_lowercase[:20]
+
+
+def typo(rng, word, nb_typos):
+    """word with nb_typos random deletions, insertions, substitutions
+    or transpositions."""
+    for _ in range(nb_typos):
+        op, i, c = rng.randrange(4), rng.randrange(len(word)), rng.choice(LETTERS)
+        if op == 0:
+            word = word[:i] + word[i + 1:]
+        elif op == 1:
+            word = word[:i] + c + word[i:]
+        elif op == 2:
+            word = word[:i] + c + word[i + 1:]
+        elif i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def brute_force(words, word, max_distance):
+    """Closest words, sorted, if within max_distance of word."""
+    closest, best = [], max_distance
+    for candidate in words:
+        distance = edit_distance(word, candidate, best)
+        if distance < best:
+            closest, best = [candidate], distance
+        elif distance == best:
+            closest.append(candidate)
+    return sorted(closest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--keywords', type=int, default=20000)
+    parser.add_argument('-q', '--queries', type=int, default=50)
+    parser.add_argument('-d', '--distances', type=int, nargs='+', default=[1, 2])
+    args = parse_args(parser)
+
+    rng = random.Random(3)
+    words = set()
+    while len(words) < args.keywords:
+        words.add(''.join(rng.choice(LETTERS) for _ in range(rng.randint(4, 14))))
+    words = sorted(words)
+
+    for d in args.distances:
+        start = time.time()
+        fuzzy = FuzzyKeywords(words, max_distance=d)
+        build = time.time() - start
+
+        queries = [typo(rng, rng.choice(words), rng.randint(1, d)) for _ in range(args.queries)]
+        start = time.time()
+        expected = [brute_force(words, q, d) for q in queries]
+        baseline = time.time() - start
+        found = [fuzzy.lookup(q) for q in queries]
+        recall = sum(1 for e, f in zip(expected, found) if e == f) / float(len(queries))
+
+        print('( ) distance {0}: {1} keywords, {2} deletes built in {3:.2f}s, '
+              '{4:.1%} lookups as brute force'.format(d, len(words), len(fuzzy), build, recall))
+        show('brute force, {0} lookups'.format(len(queries)), baseline)
+        show('deletes, {0} lookups'.format(len(queries)),
+             best_of(lambda: [fuzzy.lookup(q) for q in queries]), baseline=baseline)
+
+
+if __name__ == '__main__':
+    main()
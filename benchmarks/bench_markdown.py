@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Markdown rendering of graph texts, with the per-thread Markdown
+instance and the cache of rendered texts, against a new Markdown
+instance for each text.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+
+import markdown
+
+from common import best_of, parse_args, random_descriptor, show
+
+from graphdash.markdown_filter import EXTENSIONS, MD_CACHE, get_markdown, md_convert
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--texts', type=int, default=2000,
+                        help='number of texts rendered, as for a page')
+    parser.add_argument('-d', '--distinct', type=int, default=500,
+                        help='number of distinct texts among them')
+    args = parse_args(parser)
+
+    rng = random.Random(1)
+    distinct = [random_descriptor(rng, i).get('text', 'no *text*') for i in range(args.distinct)]
+    texts = [rng.choice(distinct) for _ in range(args.texts)]
+
+    def new_instances():
+        for txt in texts:
+            markdown.markdown(txt, extensions=EXTENSIONS)
+
+    def one_instance():
+        md = get_markdown()
+        for txt in texts:
+            md.convert(txt)
+
+    def cached():
+        for txt in texts:
+            md_convert(txt)
+
+    MD_CACHE.clear()
+    cold = best_of(cached, repeat=1)
+    baseline = best_of(new_instances)
+
+    print('( ) {0} texts, {1} distinct'.format(args.texts, len(set(texts))))
+    show('new instance per text', baseline)
+    show('thread-local instance', best_of(one_instance), baseline=baseline)
+    show('cache, cold', cold, baseline=baseline)
+    show('cache, warm', best_of(cached), baseline=baseline)
+
+
+if __name__ == '__main__':
+    main()
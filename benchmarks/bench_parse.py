@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parsing of metadata files when loading, in forked worker
+processes against serially in the loading process.
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import multiprocessing
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+
+from common import best_of, parse_args, show, write_root
+
+from graphdash.load import load_data
+
+
+def load(root, workers):
+    with redirect_stdout(io.StringIO()):
+        return load_data(root, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--graphs', type=int, default=20000)
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=[2, 4, multiprocessing.cpu_count()])
+    args = parse_args(parser)
+
+    root = tempfile.mkdtemp(prefix='graphdash-bench-')
+    try:
+        write_root(root, args.graphs)
+        print('( ) {0} files in {1}'.format(args.graphs, root))
+
+        serial = best_of(lambda: load(root, 1))
+        show('1 worker', serial)
+        for workers in sorted(set(w for w in args.workers if w > 1)):
+            show('{0} workers'.format(workers), best_of(lambda: load(root, workers)),
+                 baseline=serial)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
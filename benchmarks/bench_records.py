@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Memory of loaded trees of synthetic graphs, with graph, family and
+label records against the SemiFrozenDict containers used before.
+
+Each size is measured in its own forked process, from its resident
+memory. Strings are shared by both containers, so the difference
+between them is the containers only.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import multiprocessing
+import time
+
+from common import parse_args, random_tree
+
+from graphdash.defaults import FamilyData, GraphData, LabelData
+from graphdash.struct.semifrozendict import SemiFrozenDict
+from graphdash.struct.tree import Tree
+
+
+class HashableSemiFrozenDict(SemiFrozenDict):
+    """Labels as they were before records."""
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+
+def rss():
+    """Resident memory of the process, in MB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024.0
+
+
+def copy_tree(data, graph_cls, family_cls, label_cls):
+    """Copy of the containers of data, with the given classes."""
+    labels = {}  # id -> copied label, labels may be shared
+
+    def copy_labels(label_set):
+        copied = set()
+        for label in label_set:
+            if id(label) not in labels:
+                labels[id(label)] = label_cls(label.items())
+            copied.add(labels[id(label)])
+        return copied
+
+    def copy_graph(graph_data):
+        values = dict(graph_data.items())
+        values['index'] = set(graph_data.index)
+        values['labels'] = copy_labels(graph_data.labels)
+        return graph_cls(values)
+
+    copy = Tree(factory=lambda: None)
+    for path, node in data.iter_all_nodes():
+        values = dict(node.data.items())
+        values['labels'] = copy_labels(node.data.labels)
+        values['graphs'] = [copy_graph(g) for g in node.data.graphs]
+        copy.create_from_path(path).data = family_cls(values)
+    return copy
+
+
+def measure(nb_graphs, conn):
+    gc.collect()
+    before, start = rss(), time.time()
+    data = random_tree(nb_graphs)
+    gc.collect()
+    loaded, duration = rss() - before, time.time() - start
+
+    sizes = []
+    for classes in [(GraphData, FamilyData, LabelData),
+                    (SemiFrozenDict, SemiFrozenDict, HashableSemiFrozenDict)]:
+        before = rss()
+        copy = copy_tree(data, *classes)
+        gc.collect()
+        sizes.append(rss() - before)
+        del copy
+        gc.collect()
+
+    conn.send((loaded, duration, sizes))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--graphs', type=int, nargs='+', default=[100000, 1000000])
+    args = parse_args(parser)
+
+    ctx = multiprocessing.get_context('fork')
+    for nb_graphs in args.graphs:
+        conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=measure, args=(nb_graphs, child_conn))
+        process.start()
+        loaded, duration, (records, dicts) = conn.recv()
+        process.join()
+
+        print('( ) {0} graphs loaded in {1:.1f}s, {2:.0f}MB'.format(nb_graphs, duration, loaded))
+        print('    containers: {0:.0f}MB with records, {1:.0f}MB with dicts (x{2:.1f})'.format(
+            records, dicts, dicts / records))
+
+
+if __name__ == '__main__':
+    main()
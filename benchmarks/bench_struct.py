@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmarks of the struct package: the path indexed Tree against
+the former recursive one, on deep and wide trees, the LRUCache, and
+records against SemiFrozenDict.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+
+from common import best_of, parse_args, show
+
+from graphdash.defaults import GraphData, default_graph_data
+from graphdash.struct.lrucache import LRUCache
+from graphdash.struct.semifrozendict import SemiFrozenDict
+from graphdash.struct.tree import Tree
+
+
+class RecursiveTree(object):
+    """Tree as it was before nodes were indexed by path."""
+    __slots__ = ['sons', 'parent', 'data', '__factory']
+
+    def __init__(self, factory=dict):
+        self.data = factory()
+        self.__factory = factory
+        self.sons = {}
+        self.parent = None
+
+    def create_from_path(self, path):
+        if not path:
+            return self
+        first, others = path[0], path[1:]
+        if first not in self.sons:
+            self.sons[first] = RecursiveTree(factory=self.__factory)
+            self.sons[first].parent = self
+        return self.sons[first].create_from_path(others)
+
+    def get_from_path(self, path):
+        if not path:
+            return self
+        first, others = path[0], path[1:]
+        if first not in self.sons:
+            return
+        return self.sons[first].get_from_path(others)
+
+    def iter_all_parents(self):
+        if self.parent is not None:
+            yield self.parent
+            for parent in self.parent.iter_all_parents():
+                yield parent
+
+    def iter_all_nodes(self, path=()):
+        yield path, self
+        for son_name in self.sons:
+            son = self.sons[son_name]
+            for node_path, node in son.iter_all_nodes(path + (son_name,)):
+                yield node_path, node
+
+
+SHAPES = {
+    # A chain of 200 families, and the path of each node
+    'deep': [tuple('n{0}'.format(i) for i in range(d)) for d in range(1, 201)],
+    # 200 families of 100 families each
+    'wide': [('w{0}'.format(i // 100), 'x{0}'.format(i % 100)) for i in range(20000)],
+}
+
+
+def bench_tree(shape, number):
+    paths = SHAPES[shape]
+    rng = random.Random(0)
+    sample = [rng.choice(paths) for _ in range(number)]
+
+    for name in 'create', 'get', 'iter_all_nodes', 'iter_all_parents':
+        times = []
+        for cls in RecursiveTree, Tree:
+            tree = cls()
+            for path in paths:
+                tree.create_from_path(path)
+            leaves = [tree.get_from_path(p) for p in sample]
+
+            if name == 'create':
+                def run():
+                    t = cls()
+                    for path in paths:
+                        t.create_from_path(path)
+            elif name == 'get':
+                def run():
+                    for path in sample:
+                        tree.get_from_path(path)
+            elif name == 'iter_all_nodes':
+                def run():
+                    for _ in tree.iter_all_nodes():
+                        pass
+            else:
+                def run():
+                    for leaf in leaves:
+                        for _ in leaf.iter_all_parents():
+                            pass
+            times.append(best_of(run))
+
+        show('{0} {1}, recursive'.format(shape, name), times[0])
+        show('{0} {1}, indexed'.format(shape, name), times[1], baseline=times[0])
+
+
+def bench_cache(number):
+    keys = list(range(number))
+    cache = LRUCache(max_entries=number // 2)
+
+    def set_all():
+        for key in keys:
+            cache.set(key, key)
+
+    def get_all():
+        for key in keys:
+            cache.get(key)
+
+    show('LRUCache set x{0}, with evictions'.format(number), best_of(set_all))
+    show('LRUCache get x{0}, half hits'.format(number), best_of(get_all))
+
+
+def bench_records(number):
+    template = dict(default_graph_data().items())
+
+    def build(cls):
+        return lambda: [cls(template) for _ in range(number)]
+
+    def read(items):
+        return lambda: [(g['title'], g['index'], g['rank']) for g in items]
+
+    dicts = build(SemiFrozenDict)()
+    records = build(GraphData)()
+
+    baseline = best_of(build(SemiFrozenDict))
+    show('SemiFrozenDict create x{0}'.format(number), baseline)
+    show('GraphData create x{0}'.format(number), best_of(build(GraphData)), baseline=baseline)
+
+    baseline = best_of(read(dicts))
+    show('SemiFrozenDict read x{0}'.format(number), baseline)
+    show('GraphData read x{0}'.format(number), best_of(read(records)), baseline=baseline)
+    show('GraphData attributes x{0}'.format(number),
+         best_of(lambda: [(g.title, g.index, g.rank) for g in records]), baseline=baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=5000,
+                        help='number of operations of each benchmark')
+    args = parse_args(parser)
+
+    for shape in sorted(SHAPES):
+        bench_tree(shape, args.number)
+    bench_cache(args.number)
+    bench_records(args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+Substring search of freetext pieces, with the trigram index
+against a scan of the whole token vocabulary.
+"""
+
+from __future__ import print_function
+
+import argparse
+
+from common import best_of, parse_args, random_tree, show
+
+from graphdash.search import SearchIndex
+
+PIECES = ['a', 'mu', 'alp', 'lph', 'ega', 'memory', 'x1', 'x12', 'hroug', 'zzz']
+
+
+def scan(index, piece):
+    """Ids of graphs having a token containing piece, as before trigrams."""
+    gids = set()
+    for token, token_gids in index._tokens.items():
+        if piece in token:
+            gids.update(token_gids)
+    return gids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--graphs', type=int, default=20000)
+    args = parse_args(parser)
+
+    index = SearchIndex(random_tree(args.graphs))
+    print('( ) {graphs} graphs, {tokens} tokens, {ngrams} trigrams'.format(**index.stats()))
+
+    for piece in PIECES:
+        assert index._containing(piece) == scan(index, piece), piece
+        before = best_of(lambda: scan(index, piece), repeat=5)
+        after = best_of(lambda: index._containing(piece), repeat=5)
+        show('scan     {0!r}'.format(piece), before)
+        show('trigrams {0!r}'.format(piece), after, baseline=before)
+
+
+if __name__ == '__main__':
+    main()
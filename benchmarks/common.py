@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers shared by benchmarks, run from the repository as scripts:
+
+    python benchmarks/bench_<name>.py --help
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import os.path as op
+import random
+import sys
+import timeit
+from contextlib import redirect_stdout
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# graphdash builds its app when imported, from the command line
+# and the CONF variable, so it is imported on the test data
+os.environ.setdefault('CONF', op.join(ROOT, 'tests', 'test.yaml'))
+ARGV, sys.argv[1:] = sys.argv[1:], []
+
+with redirect_stdout(io.StringIO()):
+    import graphdash  # noqa: F401
+
+WORDS = ('alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi '
+         'omicron pi rho sigma tau upsilon phi chi psi omega the of and cpu memory '
+         'latency throughput error').split()
+FAMILIES = ['A', 'B', 'C', 'Dé']
+LABELS = ['new', 'update', 'obsolete', 'bugfix', 'error',
+          {'name': 'dct', 'text': 'D', 'color': 'red'}]
+
+
+def parse_args(parser):
+    return parser.parse_args(ARGV)
+
+
+def random_descriptor(rng, i):
+    """Metadata of a synthetic graph, as found in YAML files."""
+    descriptor = {
+        'name' : 'g{0}.png'.format(i),
+        'title': ' '.join(rng.sample(WORDS, rng.randint(1, 5))) + ' *x{0}*'.format(i),
+    }
+    depth = rng.randint(0, 4)
+    if depth:
+        descriptor['family'] = [rng.choice(FAMILIES) + str(rng.randint(0, 3))
+                                for _ in range(depth)]
+    if rng.random() < 0.7:
+        descriptor['index'] = rng.sample(WORDS, rng.randint(0, 4))
+    if rng.random() < 0.3:
+        descriptor['labels'] = rng.sample(LABELS, rng.randint(1, 2))
+    if rng.random() < 0.5:
+        descriptor['text'] = ' '.join(rng.sample(WORDS, 8)) + '\n\n**bold** `code`'
+    if rng.random() < 0.2:
+        descriptor['pretext'] = 'pre ' + ' '.join(rng.sample(WORDS, 5))
+    return descriptor
+
+
+def write_root(root, nb_graphs, seed=1):
+    """Root directory of nb_graphs metadata files."""
+    import yaml
+
+    rng = random.Random(seed)
+    for i in range(nb_graphs):
+        directory = op.join(root, 'd{0}'.format(i % 13))
+        if not op.isdir(directory):
+            os.makedirs(directory)
+        with open(op.join(directory, 'g{0}.yaml'.format(i)), 'w') as f:
+            yaml.safe_dump(random_descriptor(rng, i), f, allow_unicode=True)
+    return root
+
+
+def random_tree(nb_graphs, seed=1):
+    """Loaded tree of nb_graphs graphs, without files."""
+    from graphdash.defaults import default_family_data, default_graph_data
+    from graphdash.load import handle_family, post_load
+    from graphdash.struct.tree import Tree
+
+    rng = random.Random(seed)
+    data = Tree(factory=default_family_data)
+
+    for i in range(nb_graphs):
+        descriptor = random_descriptor(rng, i)
+        family_tuple = tuple(handle_family(f) for f in descriptor.pop('family', ['Default']))
+        graph_data = default_graph_data()
+        graph_data.update(descriptor)
+        data.create_from_path(family_tuple).data['graphs'].append(graph_data)
+
+    with redirect_stdout(io.StringIO()):
+        post_load(data)
+    return data
+
+
+def best_of(function, repeat=3, number=1):
+    """Best time of one call, in seconds."""
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def show(name, seconds, baseline=None):
+    if baseline is None:
+        print('{0:<40} {1:10.3f} ms'.format(name, seconds * 1e3))
+    else:
+        print('{0:<40} {1:10.3f} ms  (x{2:.1f})'.format(name, seconds * 1e3, baseline / seconds))
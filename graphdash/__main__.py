@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from . import app, CONF
+from .routes import COMMAND
 
 
 def main():
+    if COMMAND == 'compile':
+        # Already compiled when loading
+        return
     app.run('0.0.0.0', port=CONF['port'], debug=CONF['debug'])
 
 
@@ -1,6 +1,5 @@
 (function() {
-  var getParameterByName,
-    slice = [].slice;
+  var getParameterByName;
 
   getParameterByName = function(name) {
     var regex, results;
@@ -21,7 +20,7 @@
   }
 
   $(document).ready(function() {
-    var params, spaces, template;
+    var completion, params, spaces, template;
     $.widget("ui.autocomplete", $.ui.autocomplete, {
       options: {
         maxItems: 9999
@@ -99,41 +98,43 @@
       $("#form").submit();
     });
     spaces = RegExp(' \\s*');
-    $.ajax({
-      url: URL_TAGS,
-      type: "get"
-    }).done(function(response, textStatus, jqXHR) {
-      var t, tags;
-      tags = slice.call(response.tags).concat(slice.call((function() {
-          var j, len, ref, results1;
-          ref = response.tags;
-          results1 = [];
-          for (j = 0, len = ref.length; j < len; j++) {
-            t = ref[j];
-            results1.push('-' + t);
-          }
-          return results1;
-        })()));
-      $("#box").autocomplete({
-        minLength: 0,
-        maxItems: 20,
-        focus: function(request, ui) {
-          var terms;
-          terms = this.value.split(spaces);
-          terms.pop();
-          terms.push(ui.item.value);
-          this.value = terms.join(" ");
-          return false;
-        },
-        source: function(request, resp) {
-          return resp($.ui.autocomplete.filter(tags, request.term.split(spaces).pop()));
-        },
-        select: function(event, ui) {
-          this.value = this.value + ' ';
-          $("#form").submit();
-          return false;
+    completion = null;
+    $("#box").autocomplete({
+      minLength: 0,
+      maxItems: 20,
+      delay: 150,
+      focus: function(request, ui) {
+        var terms;
+        terms = this.value.split(spaces);
+        terms.pop();
+        terms.push(ui.item.value);
+        this.value = terms.join(" ");
+        return false;
+      },
+      source: function(request, resp) {
+        if (completion != null) {
+          completion.abort();
         }
-      });
+        completion = $.ajax({
+          url: URL_COMPLETE,
+          type: "get",
+          data: {
+            prefix: request.term.split(spaces).pop(),
+            limit: 20
+          }
+        });
+        completion.done(function(response, textStatus, jqXHR) {
+          resp(response.tags);
+        });
+        completion.fail(function() {
+          resp([]);
+        });
+      },
+      select: function(event, ui) {
+        this.value = this.value + ' ';
+        $("#form").submit();
+        return false;
+      }
     });
     $("input:text, textarea").each(function() {
       var $this;
@@ -3,6 +3,7 @@
 import argparse
 
 from .struct.semifrozendict import SemiFrozenDict
+from .struct.record import Record
 
 
 # GRAPH METADATA
@@ -14,10 +15,16 @@ SINK = 'Default'
 DEFAULT_FAMILY = ()
 
 
+class GraphData(Record):
+    """Graph structure, one per graph descriptor."""
+    __slots__ = _fields = ('name', 'title', 'index', 'pretext', 'text', 'file',
+                           'export', 'rank', 'showtitle', 'labels', 'other', 'id')
+
+
 def default_graph_data():
     """Default graph data.
     """
-    return SemiFrozenDict({
+    return GraphData({
         'name'      : None,
         'title'     : 'No *title* provided',
         'index'     : set(),
@@ -35,10 +42,15 @@ def default_graph_data():
 
 # FAMILY METADATA
 #
+class FamilyData(Record):
+    """Family structure, one per tree node."""
+    __slots__ = _fields = ('text', 'rank', 'alias', 'labels', 'graphs')
+
+
 def default_family_data():
     """Default family data.
     """
-    return SemiFrozenDict({
+    return FamilyData({
         'text'   : '',
         'rank'   : None,
         'alias'  : None,
@@ -49,16 +61,36 @@ def default_family_data():
 
 # LABEL METADATA
 #
-class HashableSemiFrozenDict(SemiFrozenDict):
-    """Ad hoc label structure, to allow set of dicts."""
+class LabelData(Record):
+    """Ad hoc label structure, to allow set of labels.
+    The hash is computed once, until the label is modified.
+    """
+    _fields = ('name', 'text', 'color', 'text_color', 'tooltip')
+    __slots__ = _fields + ('_hash',)
+
+    def __init__(self, *args, **kwargs):
+        self._hash = None
+        super(LabelData, self).__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        self._hash = None
+        super(LabelData, self).__setitem__(key, value)
+
+    def __setattr__(self, key, value):
+        if key in self._fields:
+            object.__setattr__(self, '_hash', None)
+        object.__setattr__(self, key, value)
+
     def __hash__(self):
-        return hash(frozenset(self.items()))
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
 
 
 def default_label_data():
     """Default label data.
     """
-    return HashableSemiFrozenDict({
+    return LabelData({
         'name'       : 'no_name_provided',
         'text'       : 'No text provided',
         'color'      : '#268bd2',
@@ -85,10 +117,49 @@ def default_conf():
         'theme'             : 'dark',
         'keep'              : 0.20,
         'logfile'           : 'webapp.log',
+        # Requests are logged verbose or compact, with hostnames
+        # resolved at most once every log_dns_ttl seconds
+        'log_format'        : 'verbose',
+        'log_dns'           : True,
+        'log_dns_ttl'       : 600,
+        # Proportion of static files requests logged
+        'log_static_sample' : 1.0,
         'raw'               : False,
         'verbose'           : False,
         'debug'             : False,
         'headless'          : False,
+        # Unknown #keywords match the closest known ones within this
+        # edit distance, 0 to disable
+        'fuzzy'             : 0,
+        # Freetext words also found as words of pretext and text
+        'fulltext'          : False,
+        # Search caches bounds, None means no limit
+        'cache_entries'     : 1024,
+        'cache_bytes'       : 64 * 1024 * 1024,
+        'cache_ttl'         : None,
+        # Rendered markdown texts, and rendering them all when loading
+        'md_cache_entries'  : 4096,
+        'prewarm'           : False,
+        # Reload data when metadata files change, checking every interval
+        'reload'            : False,
+        'reload_interval'   : 2.0,
+        # Directory keeping parsed metadata files between runs
+        'parse_cache_dir'   : None,
+        'reparse'           : False,
+        # Processes parsing metadata files and counting tag words,
+        # 1 does it in the main process
+        'parse_workers'     : 1,
+        # Compiled snapshot served instead of loading the root directory
+        'compiled'          : None,
+        # Metrics on /metrics, shared between processes through metrics_dir
+        'metrics'           : False,
+        'metrics_dir'       : None,
+        # Timing of startup phases, printed and eventually written
+        # to profile_report, with a cProfile dump in profile_dump
+        'profile_startup'   : False,
+        'profile_report'    : None,
+        'profile_dump'      : None,
+        'profile_memory'    : False,
         # Config just for the launcher, not the app
         'port'              : 5555,
         # Will not be exported if --export-conf is given
@@ -105,8 +176,8 @@ DEFAULT_FAMILIES_GLOB = '.FAMILIES.*'
 def add_boolean(parser, short_opt_on, long_opt_on, **kwargs):
     """Automatically add --stuff, --no-stuff and default for boolean option.
     """
-    dest = long_opt_on.lstrip('-')
-    long_opt_off = '--no-' + dest
+    dest = long_opt_on.lstrip('-').replace('-', '_')
+    long_opt_off = '--no-' + long_opt_on.lstrip('-')
 
     parser.add_argument(long_opt_on, short_opt_on,
                         dest=dest,
@@ -124,6 +195,10 @@ def get_parser():
     """Argument parser.
     """
     parser = argparse.ArgumentParser(description="GraphDash, a dashboard for graphs.")
+    parser.add_argument('command', nargs='?', choices=['serve', 'compile'], help="""
+    Serve the webapp (default), or compile the loaded data to the
+    compiled snapshot file, to be served later without loading.
+    """)
     parser.add_argument('-c', '--conf', help="""
     Path to configuration file.
     """)
@@ -139,6 +214,10 @@ def get_parser():
     parser.add_argument('-l', '--logfile', help="""
     Change default log file of the webapp.
     """)
+    parser.add_argument('-L', '--log-format', choices=['verbose', 'compact'], help="""
+    Format of requests in the log file, verbose on several lines,
+    or compact as one JSON line.
+    """)
     parser.add_argument('-f', '--families', help="""
     Path to families file.
     """)
@@ -163,6 +242,49 @@ def get_parser():
     Toggle headless mode: do not render pages, just search results.
     This may be useful on large data sets.
     """)
+    add_boolean(parser, '-R', '--reload', help="""
+    Toggle hot reload: watch metadata files and reload data when they change,
+    only parsing changed files.
+    """)
+    add_boolean(parser, '-m', '--prewarm', help="""
+    Toggle rendering of all markdown texts when loading, so that
+    pages are served from the markdown cache from the start.
+    """)
+    parser.add_argument('-z', '--fuzzy', type=int, help="""
+    Edit distance within which unknown #keywords match known ones.
+    """)
+    add_boolean(parser, '-x', '--fulltext', help="""
+    Toggle searching freetext words in graph texts and pretexts.
+    """)
+    parser.add_argument('-P', '--parse-cache-dir', help="""
+    Directory where parsed metadata files are kept, so that
+    next runs only parse changed files.
+    """)
+    add_boolean(parser, '-A', '--reparse', help="""
+    Toggle parsing of all metadata files, rebuilding the parse cache from scratch.
+    """)
+    parser.add_argument('-w', '--parse-workers', type=int, help="""
+    Number of processes parsing metadata files and counting tag words when loading.
+    """)
+    parser.add_argument('-S', '--compiled', help="""
+    Compiled snapshot file, served instead of loading the root directory.
+    """)
+    add_boolean(parser, '-M', '--metrics', help="""
+    Toggle metrics of requests and loading on /metrics.
+    """)
+    add_boolean(parser, '-T', '--profile-startup', help="""
+    Toggle timing of startup phases, printed when the app is ready.
+    """)
+    parser.add_argument('--profile-report', help="""
+    JSON file where the startup report is written.
+    """)
+    parser.add_argument('--profile-dump', help="""
+    File where cProfile stats of the startup are written.
+    """)
+    add_boolean(parser, '-Y', '--profile-memory', help="""
+    Toggle tracing of memory allocations at startup, for the peak.
+    This makes startup much slower.
+    """)
     parser.add_argument('-p', '--port', type=int, help="""
     When launched with Flask development server, port.
     """)
@@ -2,16 +2,50 @@
 
 from functools import wraps
 from datetime import datetime
+import json
+import random
 import socket
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 from flask import current_app, request, make_response
 
+from .struct.lrucache import LRUCache
+
 
 # Logging utils
 #
-def after_request_log(response):
-    name = dns_resolve(request.remote_addr)
-    current_app.logger.warn(u"""[client {ip} {host}] {http} "{method} {path}" {status}
+def request_logger(sampled=(), sample=1.0):
+    """after_request function logging requests, only a sample of
+    them for the sampled endpoints, like static files.
+
+    Only request fields are read here, the message is built by
+    RequestListener in the thread writing logs.
+    """
+    def after_request_log(response):
+        if request.endpoint in sampled and random.random() >= sample:
+            return response
+
+        info = {
+            'method'               : request.method,
+            'path'                 : request.path,
+            'url'                  : request.url,
+            'ip'                   : request.remote_addr,
+            'agent_platform'       : request.user_agent.platform,
+            'agent_browser'        : request.user_agent.browser,
+            'agent_browser_version': request.user_agent.version,
+            'agent'                : request.user_agent.string,
+            'http'                 : request.environ.get('SERVER_PROTOCOL'),
+            'status'               : response.status,
+        }
+        current_app.logger.warning('%s %s %s', request.method, request.path,
+                                   response.status, extra={'request': info})
+        return response
+
+    return after_request_log
+
+
+VERBOSE_FORMAT = u"""[client {ip} {host}] {http} "{method} {path}" {status}
     Request:   {method} {path}
     Version:   {http}
     Status:    {status}
@@ -20,19 +54,20 @@ def after_request_log(response):
     Hostname:  {host}
     Agent:     {agent_platform} | {agent_browser} | {agent_browser_version}
     Raw Agent: {agent}
-    """.format(method=request.method,
-               path=request.path,
-               url=request.url,
-               ip=request.remote_addr,
-               host=name if name is not None else '?',
-               agent_platform=request.user_agent.platform,
-               agent_browser=request.user_agent.browser,
-               agent_browser_version=request.user_agent.version,
-               agent=request.user_agent.string,
-               http=request.environ.get('SERVER_PROTOCOL'),
-               status=response.status))
+    """
 
-    return response
+
+def format_request(info, compact=False, dns=None):
+    """Request message, either verbose on several lines, or compact
+    as one JSON line. Hostnames are resolved if a DNSCache is given.
+    """
+    info = dict(info)
+    name = dns.resolve(info['ip']) if dns is not None else None
+    info['host'] = name if name is not None else '?'
+
+    if compact:
+        return json.dumps(info, sort_keys=True)
+    return VERBOSE_FORMAT.format(**info)
 
 
 def dns_resolve(ip_addr):
@@ -46,6 +81,78 @@ def dns_resolve(ip_addr):
     return name
 
 
+_missing = object()
+
+
+class DNSCache(object):
+    """Hostnames resolved at most once every ttl seconds per IP,
+    unknown ones included, as they are usually the slowest.
+    """
+
+    def __init__(self, ttl=600, max_entries=4096):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl,
+                               sizeof=lambda _: 0)
+
+    def resolve(self, ip_addr):
+        name = self._cache.get(ip_addr, _missing)
+        if name is _missing:
+            name = dns_resolve(ip_addr)
+            self._cache.set(ip_addr, name)
+        return name
+
+
+class RequestListener(QueueListener):
+    """Builds messages of request_logger records before handling them."""
+
+    def __init__(self, queue_, handlers, compact=False, dns=None):
+        super(RequestListener, self).__init__(queue_, *handlers,
+                                              respect_handler_level=True)
+        self._compact = compact
+        self._dns = dns
+
+    def prepare(self, record):
+        info = getattr(record, 'request', None)
+        if info is not None:
+            record.msg = format_request(info, self._compact, self._dns)
+            record.args = None
+        return record
+
+
+class LogQueue(object):
+    """Records of logger are put in a queue by request threads, and
+    handled by a listener thread with the former handlers of logger,
+    so that requests never wait for files or DNS.
+    """
+
+    def __init__(self, logger, compact=False, dns=None):
+        self._handlers = list(logger.handlers)
+        self._compact = compact
+        self._dns = dns
+        self._queue_handler = QueueHandler(None)
+        self._listener = None
+
+        for handler in self._handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(self._queue_handler)
+
+    def start(self):
+        """Also to be called in forked processes, where the listener
+        thread is gone, with a new queue as the former one may have
+        been locked when forking.
+        """
+        self._queue_handler.queue = queue.Queue(-1)
+        self._listener = RequestListener(self._queue_handler.queue, self._handlers,
+                                         self._compact, self._dns)
+        self._listener.start()
+        return self
+
+    def stop(self):
+        """Handle remaining records, then stop the listener thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
 # Cache utils
 #
 def cache(timeout):
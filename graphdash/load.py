@@ -5,13 +5,25 @@ from __future__ import with_statement, print_function
 import sys
 import os
 import os.path as op
-from operator import itemgetter
+import io
+import time
+import hashlib
+import pickle
+import multiprocessing
+import threading
+import heapq
+from collections import Counter
+from contextlib import redirect_stdout
+from operator import attrgetter
 
 import yaml
 
-from .struct.defaulttransformdict import DefaultTransformDict
+from .struct.record import Record
 from .struct.tree import Tree
 from .nlp import Cleaner, StopWords
+from .markdown_filter import md_convert, md_iconvert
+from .search import SearchIndex
+from .profiling import PROFILER
 from .defaults import (DEFAULT_FAMILY, SINK, get_parser,
                        default_graph_data, default_family_data,
                        default_label_data)
@@ -100,12 +112,13 @@ def replace_char(name, old, new):
 
 
 # We force unicode on urls, index, label names
+# They are interned, as the same names are found in many graphs
 def handle_family(family):
-    return replace_char(unicode(family), '/', '-')
+    return sys.intern(replace_char(unicode(family), '/', '-'))
 
 
 def handle_index(index):
-    return '#' + replace_char(unicode(index), ' ', '_')
+    return sys.intern('#' + replace_char(unicode(index), ' ', '_'))
 
 
 def load_conf(conf_file):
@@ -201,8 +214,8 @@ def load_families(data, family_file):
 
 
 def coercedict(e):
-    """Forcing dict conversion of dict subclasses (for labels)"""
-    return dict(e) if isinstance(e, dict) else e
+    """Forcing dict conversion of dict subclasses and records (for labels)"""
+    return dict(e.items()) if isinstance(e, (dict, Record)) else e
 
 
 def export_families(data, family_file):
@@ -273,79 +286,383 @@ def load_data_raw(data_dir):
     return data
 
 
-def load_data(data_dir):
-    """Loading data parsing conf files."""
+def load_descriptor(filepath, data_dir):
+    """Loading one metadata file, returns (family_tuple, graph_data),
+    or None if the file is not a graph descriptor.
+    """
+    try:
+        with open(filepath) as f:
+            loaded = yaml_load(f)
+
+    except yaml.YAMLError:
+        print('(!) {0} parsing failed (YAML dict expected), skipping'.format(filepath))
+        return None
+
+    if not isinstance(loaded, dict):
+        print('(!) {0} did not contain a YAML dict'.format(filepath))
+        return None
+
+    if 'family' not in loaded:
+        family_tuple = DEFAULT_FAMILY
+    else:
+        family_tuple = tuple(sanitize(loaded['family'], apply_=handle_family))
+        del loaded['family']  # we do not want to update graph_data
+
+    if 'name' not in loaded:
+        print('( ) {0} had no "name" attribute, processing as text entry'.format(filepath))
+
+    graph_data = default_graph_data()
+    graph_data.update(loaded)
+
+    def rel(f):
+        """Adjusting graph path to relative root from data_dir"""
+        return op.relpath(op.join(op.dirname(filepath), f), data_dir)
+
+    for p in 'name', 'file', 'export':
+        if graph_data[p]:
+            graph_data[p] = rel(graph_data[p])
+
+    return family_tuple, graph_data
+
+
+def stat_key(filepath):
+    """Files with the same key are not parsed again."""
+    st = os.stat(filepath)
+    return st.st_size, st.st_mtime_ns
+
+
+def timed_load_descriptor(filepath, data_dir):
+    start = time.time()
+    descriptor = load_descriptor(filepath, data_dir)
+    return descriptor, time.time() - start
+
+
+def load_descriptors_chunk(filepaths, data_dir):
+    """Loading metadata files in a worker process, returns descriptors,
+    parsing times, and warnings to be printed by the main process.
+    """
+    results = []
+    for filepath in filepaths:
+        out = io.StringIO()
+        with redirect_stdout(out):
+            descriptor, duration = timed_load_descriptor(filepath, data_dir)
+        results.append((descriptor, duration, out.getvalue()))
+    return results
+
+
+def parse_worker(conn, data_dir):
+    """Parsing chunks of files received on conn, until None is received."""
+    for filepaths in iter(conn.recv, None):
+        conn.send(load_descriptors_chunk(filepaths, data_dir))
+    conn.close()
+
+
+# Number of files given at once to parsing processes
+PARSE_CHUNK = 256
+
+# Set in the thread forking worker processes while loading, and so in
+# these processes, which must not restart what forked app processes do
+FORKING = threading.local()
+
+
+def start_worker(process):
+    FORKING.worker = True
+    try:
+        process.start()
+    finally:
+        FORKING.worker = False
+
+
+def in_worker():
+    """Whether this process is a worker forked while loading."""
+    return getattr(FORKING, 'worker', False)
+
+
+def iter_load_descriptors(filepaths, data_dir, workers=1):
+    """Yield (descriptor, parsing time) for each file, in order.
+    With several workers, files are parsed in forked processes.
+    """
+    if (workers <= 1 or len(filepaths) <= PARSE_CHUNK
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        for filepath in filepaths:
+            yield timed_load_descriptor(filepath, data_dir)
+        return
+
+    # Data is loaded while graphdash is being imported, so pools pickling
+    # tasks from another thread would deadlock on the import lock.
+    # Here everything is sent and received from the current thread.
+    ctx = multiprocessing.get_context('fork')
+    chunks = [filepaths[i:i + PARSE_CHUNK] for i in range(0, len(filepaths), PARSE_CHUNK)]
+    conns, processes = [], []
+
+    try:
+        for chunk in chunks[:workers]:
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=parse_worker, args=(child_conn, data_dir))
+            process.daemon = True
+            start_worker(process)
+            child_conn.close()
+            conn.send(chunk)
+            conns.append(conn)
+            processes.append(process)
+
+        # Chunks are given in turn, so results come back in order
+        # and warnings are printed as when parsing serially
+        for i in range(len(chunks)):
+            conn = conns[i % len(conns)]
+            results = conn.recv()
+            if i + len(conns) < len(chunks):
+                conn.send(chunks[i + len(conns)])
+
+            for descriptor, duration, output in results:
+                sys.stdout.write(output)
+                yield descriptor, duration
+
+        for conn in conns:
+            conn.send(None)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for conn in conns:
+            conn.close()
+
+
+def load_data(data_dir, parsed=None, workers=1):
+    """Loading data parsing conf files.
+
+    If given, parsed maps file paths to (stat_key, descriptor, parsing time)
+    of previous loadings. Only files whose key changed are parsed, and parsed
+    is updated. With several workers, files are parsed in parallel.
+    """
     data, nb_graphs = Tree(factory=default_family_data), 0
+    nb_reused, time_parsing, time_saved = 0, 0.0, 0.0
 
     if not op.isdir(data_dir):
         print('(!) {0} is not a directory'.format(data_dir))
         return data
 
-    for filepath in iter_all_files(data_dir, ['.txt', '.yaml', '.yml']):
-        try:
-            with open(filepath) as f:
-                loaded = yaml_load(f)
+    with PROFILER.phase('walk'):
+        filepaths = list(iter_all_files(data_dir, ['.txt', '.yaml', '.yml']))
+        descriptors, keys = {}, {}
+        to_parse = []
+
+        for filepath in filepaths:
+            if parsed is not None:
+                # Keys are taken before parsing, so later changes are not missed
+                keys[filepath] = stat_key(filepath)
+                if filepath in parsed and parsed[filepath][0] == keys[filepath]:
+                    _, descriptors[filepath], duration = parsed[filepath]
+                    nb_reused += 1
+                    time_saved += duration
+                    continue
+            to_parse.append(filepath)
+
+    start = time.time()
+    with PROFILER.phase('parse'):
+        loaded = iter_load_descriptors(to_parse, data_dir, workers)
+
+        for filepath, (descriptor, duration) in zip(to_parse, loaded):
+            descriptors[filepath] = descriptor
+            time_parsing += duration
+            if parsed is not None:
+                parsed[filepath] = keys[filepath], descriptor, duration
+
+    with PROFILER.phase('build'):
+        for filepath in filepaths:
+            descriptor = descriptors[filepath]
+            if descriptor is None:
+                continue
 
-        except yaml.YAMLError:
-            print('(!) {0} parsing failed (YAML dict expected), skipping'.format(filepath))
-            continue
+            family_tuple, graph_data = descriptor
 
-        if not isinstance(loaded, dict):
-            print('(!) {0} did not contain a YAML dict'.format(filepath))
-            continue
+            node = data.create_from_path(family_tuple)
+            # post_load modifies graph data, parsed descriptors are kept intact
+            node.data['graphs'].append(graph_data.copy())
+            nb_graphs += 1
 
-        if 'family' not in loaded:
-            family_tuple = DEFAULT_FAMILY
-        else:
-            family_tuple = tuple(sanitize(loaded['family'], apply_=handle_family))
-            del loaded['family']  # we do not want to update graph_data
+    PROFILER.count('files', len(filepaths))
+    PROFILER.count('files_parsed', len(to_parse))
+    PROFILER.count('files_reused', nb_reused)
 
-        if 'name' not in loaded:
-            print('( ) {0} had no "name" attribute, processing as text entry'.format(filepath))
+    if parsed is not None:
+        for filepath in set(parsed) - set(filepaths):
+            del parsed[filepath]
 
-        graph_data = default_graph_data()
-        graph_data.update(loaded)
+    print('( ) {0} graphs loaded from {1}'.format(nb_graphs, data_dir))
+    print(('( ) {0} files parsed in {1:.2f}s ({2:.2f}s with {3} workers), '
+           '{4} reused saving {5:.2f}s').format(
+               len(to_parse), time_parsing, time.time() - start, workers,
+               nb_reused, time_saved))
+    return data
 
-        def rel(f):
-            """Adjusting graph path to relative root from data_dir"""
-            return op.relpath(op.join(op.dirname(filepath), f), data_dir)
 
-        for p in 'name', 'file', 'export':
-            if graph_data[p]:
-                graph_data[p] = rel(graph_data[p])
+# Bumped when descriptors change, older caches are then ignored
+PARSE_CACHE_VERSION = 2
 
-        node = data.create_from_path(family_tuple)
-        node.data['graphs'].append(graph_data)
-        nb_graphs += 1
 
-    print('( ) {0} graphs loaded from {1}'.format(nb_graphs, data_dir))
+def parse_cache_file(cache_dir, data_dir):
+    """Each data directory has its own cache file."""
+    digest = hashlib.sha1(data_dir.encode('utf-8')).hexdigest()[:16]
+    return op.join(cache_dir, 'parsed_{0}.pickle'.format(digest))
+
+
+def load_parse_cache(cache_file):
+    """Loading parsed files from previous runs."""
+    if not op.isfile(cache_file):
+        print('( ) Parse cache {0} does not exist yet'.format(cache_file))
+        return {}
+
+    try:
+        with open(cache_file, 'rb') as f:
+            version, parsed = pickle.load(f)
+    except Exception as e:
+        # Truncated or foreign file, we will just parse everything
+        print('(!) Parse cache {0} could not be read: {1!r}'.format(cache_file, e))
+        return {}
+
+    if version != PARSE_CACHE_VERSION:
+        print('(!) Parse cache {0} has version {1}, expected {2}, ignoring it'.format(
+            cache_file, version, PARSE_CACHE_VERSION))
+        return {}
+
+    print('( ) {0} parsed files loaded from {1}'.format(len(parsed), cache_file))
+    return parsed
+
+
+def export_parse_cache(parsed, cache_file):
+    """Export parsed files, for next runs."""
+    cache_dir = op.dirname(cache_file)
+    if not op.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Several workers may write at the same time, the last one wins
+    tmp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        pickle.dump((PARSE_CACHE_VERSION, parsed), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+    print('( ) {0} parsed files exported to {1}'.format(len(parsed), cache_file))
+
+
+# Bumped when the compiled snapshot layout changes
+COMPILED_VERSION = 6
+
+# Configuration the compiled snapshot depends on
+COMPILED_CONF_KEYS = ('root', 'families', 'raw', 'keep', 'headless', 'fuzzy', 'fulltext')
+
+
+def compiled_header(conf, nb_graphs=None):
+    return {
+        'version': COMPILED_VERSION,
+        'conf'   : dict((k, conf[k]) for k in COMPILED_CONF_KEYS),
+        'graphs' : nb_graphs,
+    }
+
+
+def flatten_tree(data):
+    """Nodes data of the tree, by path, parents first. Pickling the tree
+    itself would recurse once per level, and fail on deep trees."""
+    return [(node_path, node.data) for node_path, node in data.iter_all_nodes()]
+
+
+def unflatten_tree(nodes):
+    """Tree of nodes data given by flatten_tree."""
+    data = Tree(factory=default_family_data)
+    for node_path, node_data in nodes:
+        data.create_from_path(node_path).data = node_data
     return data
 
 
+def export_compiled(data, tags, index, completer, conf, compiled_file):
+    """Export everything built from data, so that it can be served
+    without parsing metadata files again.
+    """
+    compiled_dir = op.dirname(compiled_file)
+    if compiled_dir and not op.isdir(compiled_dir):
+        os.makedirs(compiled_dir)
+
+    tmp_file = '{0}.{1}.tmp'.format(compiled_file, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as f:
+            # The header is read first, to check the snapshot before loading it
+            pickle.dump(compiled_header(conf, len(index)), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((flatten_tree(data), tags, index, completer), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, compiled_file)
+    except BaseException:
+        # No partial snapshot is left
+        if op.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+    print('( ) {0} graphs compiled to {1}'.format(len(index), compiled_file))
+
+
+def load_compiled(compiled_file, conf):
+    """Loading a compiled snapshot, returns (data, tags, index, completer),
+    or None if it cannot be used with this configuration.
+    """
+    if not op.isfile(compiled_file):
+        print('(!) Compiled snapshot {0} does not exist'.format(compiled_file))
+        return None
+
+    start = time.time()
+    expected = compiled_header(conf)
+
+    try:
+        with open(compiled_file, 'rb') as f:
+            header = pickle.load(f)
+
+            if header['version'] != expected['version']:
+                print('(!) Compiled snapshot {0} has version {1}, expected {2}'.format(
+                    compiled_file, header['version'], expected['version']))
+                return None
+
+            if header['conf'] != expected['conf']:
+                print('(!) Compiled snapshot {0} was built with {1}, expected {2}'.format(
+                    compiled_file, header['conf'], expected['conf']))
+                return None
+
+            nodes, tags, index, completer = pickle.load(f)
+            data = unflatten_tree(nodes)
+
+    except Exception as e:
+        # Truncated or foreign file, or missing optional dependency
+        print('(!) Compiled snapshot {0} could not be read: {1!r}'.format(compiled_file, e))
+        return None
+
+    print('( ) {0} graphs loaded from {1} in {2:.2f}s'.format(
+        header['graphs'], compiled_file, time.time() - start))
+    return data, tags, index, completer
+
+
 def no_mix(data, sink=None):
     """Process of changing the tree to have either data of nodes, not both."""
     for node_path, node in data.iter_all_nodes():
-        if node.sons and node.data['graphs']:
+        if node.sons and node.data.graphs:
             # Moving graphs to the sink
             print(('(!) Family {0} had both sub-families and graphs, '
                    'moving graphs to sub-family "{1}"').format(node_path, sink))
 
             sink_node = node.create_from_path((sink,))
-            sink_node.data['graphs'].extend(node.data['graphs'])
-            node.data['graphs'] = []
+            sink_node.data.graphs.extend(node.data.graphs)
+            node.data.graphs = []
 
 
 def fill_missing_infos(data):
     """We fill missing alias/rank information."""
     for node_path, node in data.iter_all_nodes():
-        if node.data['alias'] is None:
-            node.data['alias'] = node_path[-1] if node_path else ''
-        if node.data['rank'] is None:
-            node.data['rank'] = node.data['alias'].lower()
+        if node.data.alias is None:
+            node.data.alias = node_path[-1] if node_path else ''
+        if node.data.rank is None:
+            node.data.rank = node.data.alias.lower()
 
-        for graph_data in node.data['graphs']:
-            if graph_data['rank'] is None:
-                graph_data['rank'] = graph_data['title'].lower()
+        for graph_data in node.data.graphs:
+            if graph_data.rank is None:
+                graph_data.rank = graph_data.title.lower()
 
 
 SOLARIZED = {
@@ -417,131 +734,320 @@ def enforce_types(data):
     # We properly set 'title', 'text', 'pretext' and 'alias' as unicode
     for _, node in data.iter_all_nodes():
         # This avoid warnings about mix of types in 'rank' later
-        if node.data['alias'] is not None:
-            node.data['alias'] = unicode(node.data['alias'])
+        if node.data.alias is not None:
+            node.data.alias = unicode(node.data.alias)
 
-        for graph_data in node.data['graphs']:
-            graph_data['title'] = unicode(graph_data['title'])
-            graph_data['text'] = unicode(graph_data['text'])
-            graph_data['pretext'] = unicode(graph_data['pretext'])
+        for graph_data in node.data.graphs:
+            graph_data.title = unicode(graph_data.title)
+            graph_data.text = unicode(graph_data.text)
+            graph_data.pretext = unicode(graph_data.pretext)
 
     # We properly set 'index' as a set
     for _, node in data.iter_all_nodes():
-        for graph_data in node.data['graphs']:
-            graph_data['index'] = set(sanitize(graph_data['index'], apply_=handle_index))
+        for graph_data in node.data.graphs:
+            graph_data.index = set(sanitize(graph_data.index, apply_=handle_index))
 
     # We properly set 'labels' as a set of dict
     for _, node in data.iter_all_nodes():
-        node.data['labels'] = set(sanitize(node.data['labels'], apply_=handle_label))
+        node.data.labels = set(sanitize(node.data.labels, apply_=handle_label))
 
-        for graph_data in node.data['graphs']:
-            graph_data['labels'] = set(sanitize(graph_data['labels'], apply_=handle_label))
+        for graph_data in node.data.graphs:
+            graph_data.labels = set(sanitize(graph_data.labels, apply_=handle_label))
 
 
 def propagate_labels(data):
-    """Labels propagation."""
+    """Labels propagation.
+
+    Labels of a family go down to its sub-families and their graphs,
+    labels of graphs and sub-families go up to all parent families.
+    This is one pass down and one pass up, on masks of label ids.
+    """
+    labels, ids = [], {}  # id -> label, label -> id
+    sets = {}             # mask -> labels, as masks are often shared
+
+    def to_mask(label_set):
+        mask = 0
+        for label in label_set:
+            if label not in ids:
+                ids[label] = len(labels)
+                labels.append(label)
+            mask |= 1 << ids[label]
+        return mask
+
+    def to_set(mask):
+        if mask not in sets:
+            label_set, bits = set(), mask
+            while bits:
+                bit = bits & -bits
+                label_set.add(labels[bit.bit_length() - 1])
+                bits ^= bit
+            sets[mask] = label_set
+        return set(sets[mask])
+
+    # Down, parents come first
+    nodes, down, up = [], {}, {}
+
     for _, node in data.iter_all_nodes():
-        # Down
-        for _, child in node.iter_all_nodes():
-            child.data['labels'] |= node.data['labels']
-            for graph_data in child.data['graphs']:
-                graph_data['labels'] |= node.data['labels']
-                for label in graph_data['labels']:
-                    graph_data['index'].add(label['name'])
-
-        # Up
-        for parent in node.iter_all_parents():
-            parent.data['labels'] |= node.data['labels']
-
-        for graph_data in node.data['graphs']:
-            node.data['labels'] |= graph_data['labels']
-            for parent in node.iter_all_parents():
-                parent.data['labels'] |= graph_data['labels']
+        nodes.append(node)
+        own = to_mask(node.data.labels)
+        down[node] = own | down.get(node.parent, 0)
+        up[node] = own
+
+        for graph_data in node.data.graphs:
+            graph_mask = to_mask(graph_data.labels)
+            up[node] |= graph_mask
+            graph_data.labels = to_set(graph_mask | down[node])
             # We add labels to indexes for search
-            for label in graph_data['labels']:
-                graph_data['index'].add(label['name'])
+            for label in graph_data.labels:
+                graph_data.index.add(label.name)
+
+    # Up, sub-families come first
+    for node in reversed(nodes):
+        if node.parent in up:
+            up[node.parent] |= up[node]
+        node.data.labels = to_set(down[node] | up[node])
 
 
 def sort_graphs(data):
     """Sort graphs and set graph ids."""
     for node_path, node in data.iter_all_nodes():
         # We warn about type mixing in graph ranks
-        ranks = [graph_data['rank'] for graph_data in node.data['graphs']]
+        ranks = [graph_data.rank for graph_data in node.data.graphs]
 
         if len(set(type(r) for r in ranks)) > 1:
             print(('(!) Mix of types found in graphs ranks for {0}: {1}, '
                    'skipping sort').format(node_path, ranks))
         else:
             # We sort the graphs based on their ranks
-            node.data['graphs'].sort(key=itemgetter('rank'))
+            node.data.graphs.sort(key=attrgetter('rank'))
 
         # We attribute the ids of graphs based on their ranks
-        for i, graph_data in enumerate(node.data['graphs'], start=1):
-            graph_data['id'] = i
+        for i, graph_data in enumerate(node.data.graphs, start=1):
+            graph_data.id = i
 
         # We warn about type mixing in family ranks
-        ranks = [node.sons[s].data['rank'] for s in node.sons]
+        ranks = [node.sons[s].data.rank for s in node.sons]
 
         if len(set(type(r) for r in ranks)) > 1:
             print(('(!) Mix of types found in families ranks for {0}: {1}, '
                    'using ranks as strings').format(node_path, ranks))
 
             for s in node.sons:
-                node.sons[s].data['rank'] = unicode(node.sons[s].data['rank'])
+                node.sons[s].data.rank = unicode(node.sons[s].data.rank)
 
 
 def post_load(data):
     """Here are all operations on the tree that must be done after loading.
     """
-    no_mix(data, sink=SINK)
-    enforce_types(data)
-    fill_missing_infos(data)
-    propagate_labels(data)
-    sort_graphs(data)
+    with PROFILER.phase('no_mix'):
+        no_mix(data, sink=SINK)
+    with PROFILER.phase('enforce_types'):
+        enforce_types(data)
+    with PROFILER.phase('fill_missing_infos'):
+        fill_missing_infos(data)
+    with PROFILER.phase('propagate_labels'):
+        propagate_labels(data)
+    with PROFILER.phase('sort_graphs'):
+        sort_graphs(data)
 
 
 # Almost all punctuation except -+/%_
 REMOVED_CHARS = ' \t\n\r\v\f!"\'#$&()*,.:;<=>?@[\\]^`{|}~'
-PUNCTUATION_LEFT = set('-+/%_')  # these were not removed
+PUNCTUATION_LEFT = '-+/%_'  # these were not removed
 
-CLEANER = Cleaner(REMOVED_CHARS)
+# Whitespace is left to split words, so whole strings are cleaned at once
+CLEANER = Cleaner(REMOVED_CHARS.lstrip(' \t\n\r\v\f'))
 STOP_WORDS = StopWords('english')
 
 
-def yield_clean_words(string):
-    for word in string.split():
-        word = CLEANER.clean(word)
-        if not word or word.isdigit() or set(word).issubset(PUNCTUATION_LEFT):
-            continue
-        if word.lower() in STOP_WORDS:
-            continue
-        yield word
+def is_clean_word(word):
+    if word.isdigit() or not word.strip(PUNCTUATION_LEFT):
+        return False
+    return word.lower() not in STOP_WORDS
+
+
+def count_words(strings):
+    """Counting clean words in strings, given as {string: occurrences}.
+    Returns (counts, spellings), both keyed on lowercased words in order
+    of first appearance, spellings giving the first spelling seen.
+    """
+    counts = Counter()
+    spellings = {}
+    lowered_words = {}  # word -> lowercased word, or '' if not clean
+    clean = CLEANER.clean
+
+    for string, occurrences in strings.items():
+        for word in clean(string).split():
+            lowered = lowered_words.get(word)
+            if lowered is None:
+                lowered = lowered_words[word] = word.lower() if is_clean_word(word) else ''
+                if lowered and lowered not in spellings:
+                    spellings[lowered] = word
+            if lowered:
+                counts[lowered] += occurrences
+
+    return counts, spellings
 
 
-def load_tags(data, keep):
-    """For autocomplete."""
+def count_words_worker(conn, strings):
+    conn.send(count_words(strings))
+    conn.close()
+
+
+# Minimum number of distinct strings given to each counting process
+COUNT_CHUNK = 20000
+
+
+def count_words_parallel(strings, workers=1):
+    """Same as count_words, strings being split in forked processes."""
+    chunk_size = max(COUNT_CHUNK, -(-len(strings) // max(workers, 1)))
+    if (len(strings) <= chunk_size
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        return count_words(strings)
+
+    # Processes inherit their chunk, and only send back counts
+    items = list(strings.items())
+    ctx = multiprocessing.get_context('fork')
+    conns, processes = [], []
+
+    try:
+        for i in range(0, len(items), chunk_size):
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=count_words_worker,
+                                  args=(child_conn, dict(items[i:i + chunk_size])))
+            process.daemon = True
+            start_worker(process)
+            child_conn.close()
+            conns.append(conn)
+            processes.append(process)
+
+        # Merging in order of chunks keeps the order of first appearance
+        counts = Counter()
+        spellings = {}
+        for conn in conns:
+            chunk_counts, chunk_spellings = conn.recv()
+            for lowered, count in chunk_counts.items():
+                if lowered not in spellings:
+                    spellings[lowered] = chunk_spellings[lowered]
+                counts[lowered] += count
+
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for conn in conns:
+            conn.close()
+
+    return counts, spellings
+
+
+def load_tags(data, keep, weights=None, workers=1):
+    """For autocomplete. If given, weights is filled with the number
+    of graphs having each keyword, and of occurrences of each word.
+    With several workers, words are counted in parallel."""
     keywords = set()
-    words = DefaultTransformDict(int, lambda s: s.lower())
+    strings = Counter()  # titles are often shared, they are split once
 
     for family_tuple, node in data.iter_all_nodes():
-        for word in yield_clean_words(' '.join(family_tuple)):
-            words[word] += 1
-        for word in yield_clean_words(node.data['alias']):
-            words[word] += 1
-
-        for graph_data in node.data['graphs']:
-            for word in yield_clean_words(graph_data['title']):
-                words[word] += 1
-            for kw in graph_data['index']:
+        strings[' '.join(family_tuple)] += 1
+        strings[node.data.alias] += 1
+
+        for graph_data in node.data.graphs:
+            strings[graph_data.title] += 1
+            for kw in graph_data.index:
                 keywords.add(kw)
+                if weights is not None:
+                    weights[kw] = weights.get(kw, 0) + 1
+
+    counts, spellings = count_words_parallel(strings, workers)
+
+    # We only keep the words who appeared the most in graph names and families,
+    # the latest seen first among equals, and all of them if keep is too small
+    # to keep any
+    ranked = list(counts.items())
+    nb_kept_words = int(keep * len(ranked)) or len(ranked)
+    kept = heapq.nlargest(nb_kept_words, range(len(ranked)),
+                          key=lambda i: (ranked[i][1], i))
+    kept.reverse()
+    kept_words = [spellings[ranked[i][0]] for i in kept]
+
+    if weights is not None:
+        for i in kept:
+            weights[spellings[ranked[i][0]]] = ranked[i][1]
 
-    # We only keep the words who appeared the most in graph names and families
-    nb_kept_words = int(keep * len(words))
-    kept_words = sorted(words, key=lambda k: words[k])[-nb_kept_words:]
     return sorted(list(keywords) + kept_words,
                   key=lambda k: k.lstrip('#').lower())
 
 
+def load_index(data, render=True, fuzzy=0, fulltext=False):
+    """For search. Without render, the index only counts matches.
+    With fuzzy, unknown keywords match known ones within this edit distance.
+    With fulltext, texts of graphs are searched too."""
+    if render:
+        # Titles and labels are often shared between graphs, they are converted once
+        titles = {}
+        labels = {}
+
+        def convert(label):
+            if label not in labels:
+                labels[label] = coercedict(label)
+            return labels[label]
+
+        def match(graph_data):
+            title = graph_data.title
+            if title not in titles:
+                titles[title] = md_iconvert(title)
+            return {
+                'title' : titles[title],
+                'text'  : graph_data.text,
+                'labels': [convert(label) for label in sort_labels(graph_data.labels)],
+                'id'    : graph_data.id,
+            }
+    else:
+        match = None
+
+    index = SearchIndex(data, match=match, fuzzy=fuzzy, fulltext=fulltext)
+    print(('( ) Search index built: {graphs} graphs, {keywords} keywords, '
+           '{tokens} tokens, {ngrams} trigrams, {bitsets} bitsets').format(**index.stats()))
+
+    stats = index.fulltext_stats()
+    if stats is not None:
+        print(('( ) Full-text index built: {documents} texts, {words} words, '
+               '{postings} postings, {positions} positions, {mb:.1f}MB').format(
+                   mb=stats['bytes'] / 2.0 ** 20, **stats))
+        PROFILER.count('fulltext_bytes', stats['bytes'])
+    return index
+
+
+def prewarm_markdown(data, texts=()):
+    """Render all texts of the tree, and some other texts, so that
+    pages are served from the markdown cache from the start."""
+    start = time.time()
+    nb_texts = 0
+
+    def iter_texts():
+        for text in texts:
+            yield text, md_convert
+
+        for _, node in data.iter_all_nodes():
+            yield node.data.text, md_convert
+
+            for graph_data in node.data.graphs:
+                yield graph_data.title, md_iconvert
+                yield graph_data.pretext, md_convert
+                yield graph_data.text, md_convert
+
+    for text, convert in iter_texts():
+        # YAML may give numbers, dates or lists, rendered with their page
+        if isinstance(text, str):
+            convert(text)
+            nb_texts += 1
+
+    print('( ) {0} texts rendered in {1:.2f}s'.format(nb_texts, time.time() - start))
+
+
 def load_themes(themes_dir):
     """Loading possible themes."""
     themes = set()
@@ -592,7 +1098,7 @@ def sort_sons(items):
 
 
 def sort_labels(labels):
-    return sorted(labels, key=lambda l: (l['color'], l['name']))
+    return sorted(labels, key=attrgetter('color', 'name'))
 
 
 def sort_indexes(indexes):
@@ -1,11 +1,32 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import threading
+
 import markdown
 
-MD = markdown.Markdown(extensions=[
+from .struct.lrucache import LRUCache
+
+EXTENSIONS = [
     'markdown.extensions.fenced_code',
     'markdown.extensions.codehilite',
-])
+]
+
+# Markdown instances keep state while converting,
+# so each thread has its own
+LOCAL = threading.local()
+
+
+def get_markdown():
+    md = getattr(LOCAL, 'md', None)
+    if md is None:
+        md = LOCAL.md = markdown.Markdown(extensions=EXTENSIONS)
+    return md
+
+
+# Rendered texts, keyed on a digest of the text
+# Bounds are set from the configuration when the app is built
+MD_CACHE = LRUCache(max_entries=4096)
 
 
 class TagStripper(object):
@@ -24,9 +45,17 @@ class TagStripper(object):
 
 TS = TagStripper('p')
 
-# Used outside this module
-md_convert = MD.convert
+
+def md_convert(txt):
+    # Metadata may be numbers or dates, as parsed from YAML
+    txt = str(txt)
+    key = hashlib.sha1(txt.encode('utf-8')).digest()
+    html = MD_CACHE.get(key)
+    if html is None:
+        html = get_markdown().convert(txt)
+        MD_CACHE.set(key, html)
+    return html
 
 
 def md_iconvert(txt):
-    return TS.strip(MD.convert(txt))
+    return TS.strip(md_convert(txt))
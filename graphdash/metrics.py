@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+Request and loading metrics, in the Prometheus text format.
+
+Each process keeps its counters and histograms in memory, and writes
+them regularly to a file of its own in a directory shared by all
+gunicorn workers, where they are summed when exposed.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path as op
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from glob import glob
+
+# Prometheus defaults, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Number of graphs
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user
+        return True
+    return True
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Metrics(object):
+    """Counters and histograms are summed over all processes writing
+    to directory, gauges are those of the exposing process.
+    Without directory, only this process is exposed.
+    """
+
+    def __init__(self, directory=None, interval=5.0):
+        self._directory = directory
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [buckets, counts, sum]
+        self._gauges = {}      # (name, labels) -> value
+        self._collectors = []
+        self._stopped = threading.Event()
+        self._file_lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def add_collector(self, collector):
+        """collector returns counters of this process as (name, labels, value),
+        for values already counted elsewhere, like cache hits."""
+        self._collectors.append(collector)
+
+    # Recording
+    #
+    def inc(self, name, value=1, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0]
+            histogram[1][bisect_left(buckets, value)] += 1
+            histogram[2] += value
+
+    def set(self, name, value, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges[key] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Duration of the block, as a gauge."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.set(name, time.time() - start, **labels)
+
+    # Sharing between processes
+    #
+    def _state(self):
+        with self._lock:
+            counters = [[n, list(l), v] for (n, l), v in self._counters.items()]
+            histograms = [[n, list(l), list(h[0]), list(h[1]), h[2]]
+                          for (n, l), h in self._histograms.items()]
+
+        if not counters and not histograms:
+            # Nothing served, like processes only parsing files
+            return None
+
+        for collector in self._collectors:
+            counters.extend([n, sorted(l.items()), v] for n, l, v in collector())
+        return {'counters': counters, 'histograms': histograms}
+
+    def _path(self):
+        return op.join(self._directory, 'metrics_{0}.json'.format(os.getpid()))
+
+    def flush(self):
+        if self._directory is None:
+            return
+        state = self._state()
+        if state is None:
+            return
+
+        path = self._path()
+        tmp = path + '.tmp'
+        with self._file_lock:
+            if self._stopped.is_set():
+                return
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.flush()
+            except (OSError, IOError) as e:
+                print('(!) Could not write metrics: {0}'.format(e))
+
+    def clean(self):
+        """Remove the files of processes which are not running anymore,
+        like those of a previous server."""
+        for path in glob(op.join(self._directory, 'metrics_*.json*')):
+            pid = op.basename(path)[len('metrics_'):].split('.')[0]
+            if pid.isdigit() and not is_running(int(pid)):
+                remove_file(path)
+
+    def start(self):
+        """Also to be called in forked processes, which start
+        with empty counters and a thread of their own."""
+        # Locks may have been held by a thread of the parent
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._counters.clear()
+        self._histograms.clear()
+
+        if self._directory is not None:
+            if not op.isdir(self._directory):
+                os.makedirs(self._directory)
+            self.clean()
+            thread = threading.Thread(target=self._run, name='graphdash-metrics')
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        """At exit, the file of this process is removed, so that
+        counters of exited workers are not summed anymore."""
+        self._stopped.set()
+        if self._directory is None:
+            return
+        with self._file_lock:
+            remove_file(self._path())
+            remove_file(self._path() + '.tmp')
+
+    def _states(self):
+        if self._directory is None:
+            state = self._state()
+            return [state] if state is not None else []
+
+        self.flush()
+        states = []
+        for path in glob(op.join(self._directory, 'metrics_*.json')):
+            try:
+                with open(path) as f:
+                    states.append(json.load(f))
+            except (OSError, IOError, ValueError):
+                # Removed or being replaced
+                continue
+        return states
+
+    # Exposing
+    #
+    def expose(self):
+        counters = {}
+        histograms = {}
+
+        for state in self._states():
+            for name, labels, value in state['counters']:
+                key = name, tuple(tuple(p) for p in labels)
+                counters[key] = counters.get(key, 0) + value
+
+            for name, labels, buckets, counts, sum_ in state['histograms']:
+                key = name, tuple(tuple(p) for p in labels)
+                if key not in histograms:
+                    histograms[key] = [buckets, [0] * len(counts), 0]
+                histogram = histograms[key]
+                histogram[1] = [a + b for a, b in zip(histogram[1], counts)]
+                histogram[2] += sum_
+
+        with self._lock:
+            gauges = dict(self._gauges)
+
+        lines = []
+        self._expose_simple(lines, counters, 'counter')
+        self._expose_simple(lines, gauges, 'gauge')
+
+        for name in sorted(set(n for n, _ in histograms)):
+            self._header(lines, name, 'histogram')
+            for key in sorted(k for k in histograms if k[0] == name):
+                buckets, counts, sum_ = histograms[key]
+                cumulated = 0
+                for le, count in zip(list(buckets) + [float('inf')], counts):
+                    cumulated += count
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, format_labels(key[1], le=format_value(le)), cumulated))
+                labels = format_labels(key[1])
+                lines.append('{0}_sum{1} {2}'.format(name, labels, format_value(sum_)))
+                lines.append('{0}_count{1} {2}'.format(name, labels, cumulated))
+
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name, type_):
+        if name in self._help:
+            lines.append('# HELP {0} {1}'.format(name, self._help[name]))
+        lines.append('# TYPE {0} {1}'.format(name, type_))
+
+    def _expose_simple(self, lines, values, type_):
+        for name in sorted(set(n for n, _ in values)):
+            self._header(lines, name, type_)
+            for key in sorted(k for k in values if k[0] == name):
+                lines.append('{0}{1} {2}'.format(name, format_labels(key[1]),
+                                                 format_value(values[key])))
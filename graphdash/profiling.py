@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing of startup phases, with optional cProfile and tracemalloc.
+"""
+
+from __future__ import print_function
+
+import cProfile
+import json
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StartupProfiler(object):
+    """Phases are only timed between start and stop, they may be
+    nested, their names are then joined with dots.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._start = None
+        self._stack = []
+        self._phases = []  # [name, depth, seconds] in starting order
+        self._counts = {}
+        self._profile = None
+        self._memory = False
+
+    def start(self, profile=False, memory=False, started=None):
+        self.enabled = True
+        self._start = started if started is not None else time.time()
+
+        if profile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if memory:
+            tracemalloc.start()
+            self._memory = True
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        self._stack.append(name)
+        phase = ['.'.join(self._stack), len(self._stack) - 1, None]
+        self._phases.append(phase)
+        start = time.time()
+        try:
+            yield
+        finally:
+            phase[2] = time.time() - start
+            self._stack.pop()
+
+    def count(self, name, value):
+        if self.enabled:
+            self._counts[name] = value
+
+    def stop(self, dump=None):
+        """Report of the startup, the cProfile stats are dumped in dump."""
+        report = {
+            'python' : platform.python_version(),
+            'total'  : time.time() - self._start,
+            'phases' : [{'name': n, 'depth': d, 'seconds': s} for n, d, s in self._phases],
+            'counts' : dict(self._counts),
+        }
+
+        if self._profile is not None:
+            self._profile.disable()
+            if dump is not None:
+                self._profile.dump_stats(dump)
+                report['profile'] = dump
+            self._profile = None
+
+        if self._memory:
+            report['memory_peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._memory = False
+
+        self.enabled = False
+        return report
+
+
+PROFILER = StartupProfiler()
+
+
+def show_profile(report):
+    print('( ) Startup took {0:.2f}s'.format(report['total']))
+    for phase in report['phases']:
+        print('    {0}{1:<{2}} {3:8.3f}s'.format(
+            '  ' * phase['depth'], phase['name'].rpartition('.')[2],
+            30 - 2 * phase['depth'], phase['seconds']))
+    for name in sorted(report['counts']):
+        print('    {0:<30} {1:>9}'.format(name, report['counts'][name]))
+    if 'memory_peak' in report:
+        print('    {0:<30} {1:>8.1f}M'.format('memory peak', report['memory_peak'] / 2.0 ** 20))
+    if 'profile' in report:
+        print('( ) Profile written to {0}'.format(report['profile']))
+
+
+def export_profile(report, report_file):
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print('( ) Startup report written to {0}'.format(report_file))
@@ -2,23 +2,39 @@
 
 from __future__ import with_statement, print_function
 
+import atexit
 import os
 import os.path as op
+import gc
+import hashlib
+import json
+import time
 import shlex
+import sys
 from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import wraps
 from glob import glob
 
 import logging
 from flask import (Flask, render_template, abort, jsonify,
                    request, send_from_directory, redirect,
-                   url_for, Response, flash)
-
-from .flask_utils import cache, after_request_log
-from .markdown_filter import md_convert, md_iconvert
+                   url_for, Response, flash, g)
+
+from .flask_utils import cache, request_logger, DNSCache, LogQueue
+from .markdown_filter import md_convert, md_iconvert, MD_CACHE
+from .metrics import Metrics, SIZE_BUCKETS, CONTENT_TYPE
+from .profiling import PROFILER, show_profile, export_profile
+from .search import Query, Words, TagCompleter
+from .struct.lrucache import LRUCache, approx_sizeof
+from .struct.tree import Tree
+from .watch import Watcher
 from .defaults import default_conf, DEFAULT_FAMILIES_GLOB
 from .load import (load_args, load_conf, load_data, load_data_raw,
-                   load_tags, load_themes, load_families,
+                   load_tags, load_index, load_themes, load_families,
                    post_load, export_conf, export_families,
+                   parse_cache_file, load_parse_cache, export_parse_cache,
+                   load_compiled, export_compiled, prewarm_markdown, in_worker,
                    sort_sons, sort_labels, sort_indexes,
                    dump_data, show_conf, show_tags, show_themes, check_theme)
 
@@ -28,6 +44,9 @@ from .load import (load_args, load_conf, load_data, load_data_raw,
 DIRNAME = op.realpath(op.dirname(__file__))
 ASSETS = op.join(DIRNAME, 'assets')
 
+# Startup is timed from here, if profiled
+STARTED = time.time()
+
 # CLI overrides env variables
 ARGS = load_args()
 CONF_FILE = os.getenv('CONF')
@@ -35,6 +54,9 @@ if 'conf' in ARGS:
     CONF_FILE = ARGS['conf']
     del ARGS['conf']  # we do not want to update CONF with 'conf' attribute
 
+# Same thing for the command, serving unless compiling
+COMMAND = ARGS.pop('command', 'serve')
+
 # We convert to abspath here because if given through
 # CLI, these are supposed to be relative to the working dir,
 # not the configuration file
@@ -42,6 +64,13 @@ if 'root' in ARGS:
     ARGS['root'] = op.realpath(ARGS['root'])
 if 'families' in ARGS:
     ARGS['families'] = op.realpath(ARGS['families'])
+if 'parse_cache_dir' in ARGS:
+    ARGS['parse_cache_dir'] = op.realpath(ARGS['parse_cache_dir'])
+if 'compiled' in ARGS:
+    ARGS['compiled'] = op.realpath(ARGS['compiled'])
+for key in 'metrics_dir', 'profile_report', 'profile_dump':
+    if key in ARGS:
+        ARGS[key] = op.realpath(ARGS[key])
 
 # Actual configuration parsing
 # conf file overrides, then CLI overrides
@@ -58,53 +87,240 @@ if not op.isabs(CONF['root']):
 # Expand symlinks
 CONF['root'] = op.realpath(CONF['root'])
 
-if CONF['raw']:
-    DATA = load_data_raw(CONF['root'])
-else:
-    DATA = load_data(CONF['root'])
+# Rendered markdown texts, shared by pages and search results
+MD_CACHE.max_entries = CONF['md_cache_entries']
+MD_CACHE.max_bytes = CONF['cache_bytes']
 
-    # Try to read the families file, describing families metadata
+if not CONF['raw']:
+    # Try to find the families file, describing families metadata
     if CONF['families'] is not None:
         if not op.isabs(CONF['families']):
             CONF['families'] = op.join(CONF_DIR, CONF['families'])
         CONF['families'] = op.realpath(CONF['families'])
-        load_families(DATA, CONF['families'])
     else:
         # If families is not set we try a default file
         # We only load if it is here to avoid triggering a warning
         FAMILIES_FILES = glob(op.join(CONF['root'], DEFAULT_FAMILIES_GLOB))
         if FAMILIES_FILES:
-            # File is here, we add it to the conf and load it
+            # File is here, we add it to the conf
             CONF['families'] = FAMILIES_FILES[0]
-            load_families(DATA, FAMILIES_FILES[0])
+
+if CONF['compiled'] is not None:
+    if not op.isabs(CONF['compiled']):
+        CONF['compiled'] = op.join(CONF_DIR, CONF['compiled'])
+    CONF['compiled'] = op.realpath(CONF['compiled'])
+
+for key in 'metrics_dir', 'profile_report', 'profile_dump':
+    if CONF[key] is not None:
+        if not op.isabs(CONF[key]):
+            CONF[key] = op.join(CONF_DIR, CONF[key])
+        CONF[key] = op.realpath(CONF[key])
+
+# Startup phases are timed from now on
+if CONF['profile_startup']:
+    PROFILER.start(profile=CONF['profile_dump'] is not None,
+                   memory=CONF['profile_memory'],
+                   started=STARTED)
+
+# Metrics of all processes are shared through metrics_dir
+METRICS = Metrics(CONF['metrics_dir'])
+METRICS.describe('graphdash_load_seconds', 'Duration of the last load, by phase.')
+METRICS.describe('graphdash_requests_total', 'Requests, by endpoint and status.')
+METRICS.describe('graphdash_request_seconds', 'Request latency, by endpoint.')
+METRICS.describe('graphdash_search_results', 'Number of graphs matching searches.')
+METRICS.describe('graphdash_cache_hits_total', 'Cache hits, by cache.')
+METRICS.describe('graphdash_cache_misses_total', 'Cache misses, by cache.')
+METRICS.describe('graphdash_tree_nodes', 'Families in the data tree.')
+METRICS.describe('graphdash_tree_graphs', 'Graphs in the data tree.')
+METRICS.describe('graphdash_tree_labels', 'Distinct labels in the data tree.')
+METRICS.describe('graphdash_data_version', 'Number of reloads.')
+
+
+@contextmanager
+def phase(name):
+    """Timed for the startup profile, and for metrics."""
+    with PROFILER.phase(name), METRICS.timer('graphdash_load_seconds', phase=name):
+        yield
+
+
+# Parsed metadata files, so that reloading only parses changed files
+PARSED = {}
+
+# They may also be kept on disk for next runs
+if CONF['parse_cache_dir'] is not None and not CONF['raw']:
+    if not op.isabs(CONF['parse_cache_dir']):
+        CONF['parse_cache_dir'] = op.join(CONF_DIR, CONF['parse_cache_dir'])
+    CONF['parse_cache_dir'] = op.realpath(CONF['parse_cache_dir'])
+    PARSE_CACHE_FILE = parse_cache_file(CONF['parse_cache_dir'], CONF['root'])
+
+    if not CONF['reparse']:
+        with phase('load_parse_cache'):
+            PARSED.update(load_parse_cache(PARSE_CACHE_FILE))
+else:
+    PARSE_CACHE_FILE = None
+
+
+def load_tree():
+    if CONF['raw']:
+        with phase('load_data'):
+            return load_data_raw(CONF['root'])
+
+    stat_keys = dict((f, PARSED[f][0]) for f in PARSED)
+    with phase('load_data'):
+        data = load_data(CONF['root'], PARSED, CONF['parse_workers'])
+
+    if PARSE_CACHE_FILE is not None:
+        if stat_keys != dict((f, PARSED[f][0]) for f in PARSED):
+            with phase('export_parse_cache'):
+                export_parse_cache(PARSED, PARSE_CACHE_FILE)
+
+    if CONF['families'] is not None:
+        with phase('load_families'):
+            load_families(data, CONF['families'])
+    return data
+
+
+# Everything built from the data, replaced as a whole when reloading,
+# so that a request always works on a consistent view
+Snapshot = namedtuple('Snapshot', ['version', 'data', 'tags', 'index', 'completer'])
+
+
+def prewarm():
+    if CONF['prewarm'] and not CONF['headless']:
+        with phase('prewarm'):
+            prewarm_markdown(SNAPSHOT.data, [CONF['header'], CONF['footer']])
+
+
+def load_snapshot(data, version=0):
+    # All operations on the tree who must be done after loading
+    with phase('post_load'):
+        post_load(data)
+
+    with phase('load_tags'):
+        # Caching for autocomplete
+        weights = {}
+        tags = load_tags(data, CONF['keep'], weights, CONF['parse_workers'])
+        completer = TagCompleter(tags, weights)
+
+    with phase('load_index'):
+        index = load_index(data, render=not CONF['headless'], fuzzy=CONF['fuzzy'],
+                           fulltext=CONF['fulltext'])
+
+    return Snapshot(version=version, data=data, tags=tags, index=index,
+                    completer=completer)
+
 
 # Exporting configuration file, except the 'export_*' attributes
 if CONF['export_conf'] is not None:
     export_conf(CONF, CONF['export_conf'],
                 exclude=('export_conf', 'export_families'))
 
-# Exporting families file
-if CONF['export_families'] is not None:
-    export_families(DATA, CONF['export_families'])
+# A compiled snapshot is served as is, unless we are compiling it
+if CONF['compiled'] is not None and COMMAND == 'serve':
+    with phase('load_compiled'):
+        COMPILED = load_compiled(CONF['compiled'], CONF)
+else:
+    COMPILED = None
+
+if COMPILED is not None:
+    SNAPSHOT = Snapshot(0, *COMPILED)
+
+    if CONF['export_families'] is not None:
+        print('(!) Families cannot be exported from a compiled snapshot, skipping export')
+else:
+    DATA = load_tree()
+
+    # Exporting families file
+    if CONF['export_families'] is not None:
+        with phase('export_families'):
+            export_families(DATA, CONF['export_families'])
+
+    SNAPSHOT = load_snapshot(DATA)
+    del DATA  # only SNAPSHOT is up to date
+
+del COMPILED
+
+if COMMAND == 'compile':
+    if CONF['compiled'] is None:
+        print('(!) No compiled snapshot file provided, use --compiled')
+    else:
+        with phase('export_compiled'):
+            export_compiled(SNAPSHOT.data, SNAPSHOT.tags, SNAPSHOT.index,
+                            SNAPSHOT.completer, CONF, CONF['compiled'])
 
-# All operations on the tree who must be done after loading
-post_load(DATA)
+if COMMAND == 'serve':
+    prewarm()
 
 # CSS themes
-THEMES = load_themes(ASSETS)
+with phase('load_themes'):
+    THEMES = load_themes(ASSETS)
 CONF['theme'] = check_theme(CONF['theme'], THEMES)
 
-# Caching for autocomplete
-TAGS = load_tags(DATA, CONF['keep'])
-
 if CONF['verbose']:
     show_conf(CONF)
     show_themes(THEMES)
-    print(dump_data(DATA))
-    show_tags(TAGS, CONF['keep'])
+    print(dump_data(SNAPSHOT.data))
+    show_tags(SNAPSHOT.tags, CONF['keep'])
+
+
+def freeze_objects():
+    """Keep all objects allocated so far out of garbage collections.
+
+    Collections write to every object they scan, so workers forked after
+    loading (gunicorn --preload) would each end up with a private copy
+    of the memory pages holding the data, instead of sharing them.
+    """
+    if not hasattr(gc, 'freeze'):
+        # Python < 3.7 and PyPy
+        return
+    # Frozen objects from a previous snapshot must be collected
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def at_fork(function):
+    """Call function in forked app processes, like gunicorn workers,
+    but not in the processes forked to parse files when reloading."""
+    if not hasattr(os, 'register_at_fork'):
+        return
+
+    def after_in_child():
+        if not in_worker():
+            function()
+
+    os.register_at_fork(after_in_child=after_in_child)
+
 
-# Caching total number of graphs
-NB_GRAPHS = sum(len(n.data['graphs']) for _, n in DATA.iter_all_nodes())
+def reload_snapshot():
+    """Reload data, parsing only changed metadata files."""
+    global SNAPSHOT
+    print('( ) Reloading data from {0}'.format(CONF['root']))
+    snapshot = load_snapshot(load_tree(), version=SNAPSHOT.version + 1)
+    SNAPSHOT = snapshot
+    clear_caches()
+    prewarm()
+    freeze_objects()
+
+
+def start_watcher():
+    return Watcher(CONF['root'], reload_snapshot,
+                   extensions=['.txt', '.yaml', '.yml'],
+                   others=[CONF['families']],
+                   interval=CONF['reload_interval']).start()
+
+
+def restart_watcher():
+    """Forked processes do not inherit the watcher thread."""
+    global WATCHER
+    WATCHER = start_watcher()
+
+
+if CONF['reload'] and COMMAND == 'serve':
+    WATCHER = start_watcher()
+
+    # With gunicorn --preload, workers are forked after loading
+    at_fork(restart_watcher)
 
 
 # PREPARING APP
@@ -117,9 +333,22 @@ handler.setLevel(logging.INFO)
 app = Flask(__name__)
 app.secret_key = 'jlrgh(*&)(&$)(#*$&'
 app.logger.addHandler(handler)
-app.after_request(after_request_log)
+app.after_request(request_logger(sampled=('get_asset', 'get_data'),
+                                 sample=CONF['log_static_sample']))
 app.jinja_env.add_extension('jinja2.ext.do')
 
+# Requests are logged from another thread, resolving hostnames there
+LOG_QUEUE = LogQueue(app.logger,
+                     compact=CONF['log_format'] == 'compact',
+                     dns=DNSCache(CONF['log_dns_ttl']) if CONF['log_dns'] else None)
+
+if COMMAND == 'serve':
+    LOG_QUEUE.start()
+    atexit.register(LOG_QUEUE.stop)
+
+    # With gunicorn --preload, workers are forked after loading
+    at_fork(LOG_QUEUE.start)
+
 
 # CUSTOM Markdown Jinja filter
 #
@@ -135,11 +364,13 @@ app.template_filter('sortindexes')(sort_indexes)
 
 # CUSTOM functions for urls in templates
 #
-up_paths = DATA.iter_upper_paths
+up_paths = Tree.iter_upper_paths
 
 
-def get(p):
-    return DATA.get_from_path(p).data
+def getter(data):
+    def get(p):
+        return data.get_from_path(p).data
+    return get
 
 
 # ROUTES
@@ -157,39 +388,87 @@ def family_index(family=None):
     else:
         family_tuple = tuple(family.rstrip('/').split('/'))
 
-    node = DATA.get_from_path(family_tuple)
+    # Pages do not change until the data is reloaded
+    snapshot = SNAPSHOT
+    key = (snapshot.version, family_tuple, CONF['theme'])
+    page = PAGE_CACHE.get(key)
+
+    if page is None:
+        page = render_family(snapshot.data, family_tuple)
+        if page is None:
+            abort(404)
+        if page[1] is None:
+            # Flashed messages are not cached
+            return page[0]
+        PAGE_CACHE.set(key, page)
+
+    html, etag = page
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def render_family(data, family_tuple):
+    """Rendered page and its ETag, None if the family does not exist.
+    """
+    node = data.get_from_path(family_tuple)
     if node is None:
-        abort(404)
+        return None
 
     kw = {
         'conf'    : CONF,
         'family'  : family_tuple,
         'text'    : node.data['text'],
-        'get'     : get,       # global function
+        'get'     : getter(data),
         'up_paths': up_paths,  # global function
     }
 
     if CONF['headless']:
-        return render_template('index.html', sons={}, **kw)
-
-    if node.data['graphs']:
-        return render_template('family.html', graphs=node.data['graphs'], **kw)
-
-    if not node.sons:
+        html = render_template('index.html', sons={}, **kw)
+    elif node.data['graphs']:
+        html = render_template('family.html', graphs=node.data['graphs'], **kw)
+    elif not node.sons:
         flash('Nothing could be loaded from {0}'.format(CONF['root']))
-    return render_template('index.html', sons=node.sons, **kw)
+        return render_template('index.html', sons=node.sons, **kw), None
+    else:
+        html = render_template('index.html', sons=node.sons, **kw)
+
+    # Versions start again from 0 on each run and in each worker,
+    # so the ETag is a digest of the page itself
+    return html, hashlib.sha1(html.encode('utf-8')).hexdigest()
 
 
 @app.route('/tags')
 def get_tags():
     return jsonify({
-        'tags': TAGS,
+        'tags': SNAPSHOT.tags,
+    })
+
+
+# Completions returned without limit, and at most
+COMPLETE_LIMIT = 20
+COMPLETE_MAX_LIMIT = 100
+
+
+@app.route('/tags/complete')
+def get_completions():
+    prefix = request.args.get('prefix', '')
+    limit = get_int_arg('limit')
+    limit = COMPLETE_LIMIT if limit is None else min(limit, COMPLETE_MAX_LIMIT)
+
+    # Excluded terms are completed too
+    sign = '-' if prefix.startswith('-') else ''
+    tags = complete_tags(SNAPSHOT, prefix[len(sign):], limit)
+
+    return jsonify({
+        'tags': [sign + t for t in tags],
     })
 
 
 @app.route('/map')
 def get_map():
-    return Response(dump_data(DATA, True) + '\n' + dump_data(DATA, False),
+    data = SNAPSHOT.data
+    return Response(dump_data(data, True) + '\n' + dump_data(data, False),
                     mimetype='text/plain')
 
 
@@ -220,39 +499,193 @@ def get_asset(filename):
 
 # SEARCH
 #
-@app.route('/search')
-def search():
-    value = request.args.get('value', '')
-
+def split_value(value):
+    """Split search value into inner and outer values."""
     # If words are after a pipe (|), we isolate them for another query
     inner_value = value.partition('|')[0].strip()
     outer_value = value.partition('|')[2].replace('|', ' ').strip()
+    return inner_value, outer_value
+
+
+def get_int_arg(name):
+    value = request.args.get(name, type=int)
+    if value is not None and value < 0:
+        abort(400)
+    return value
+
 
-    results = search_results(build_query(inner_value + ' ' + outer_value))
-    if outer_value:
-        nb_total = search_results(build_query(outer_value))['nb_matches']
+def paginate(results, offset, limit):
+    """Keep a page of graphs, in the order they are displayed.
+    """
+    matches = {}
+    aliases = {}
+    nb_kept = 0
+
+    for family in results['families']:
+        graphs = results['matches'][family]
+        if offset >= len(graphs):
+            offset -= len(graphs)
+            continue
+        if limit is not None and nb_kept >= limit:
+            break
+
+        stop = len(graphs) if limit is None else offset + limit - nb_kept
+        matches[family] = graphs[offset:stop]
+        nb_kept += len(matches[family])
+        offset = 0
+
+        # Aliases of all parent nodes, for links
+        if family:
+            parts = family.split('/')
+            for i in range(1, len(parts) + 1):
+                path = '/'.join(parts[:i])
+                aliases[path] = results['aliases'][path]
+
+    return {
+        'matches' : matches,
+        'families': [f for f in results['families'] if f in matches],
+        'aliases' : aliases,
+        'nb_page' : nb_kept,
+    }
+
+
+# Number of graphs of ranked search results, if not given
+RANKED_K = 10
+
+
+@app.route('/search')
+def search():
+    value = request.args.get('value', '')
+    offset = get_int_arg('offset')
+    limit = get_int_arg('limit')
+    sort = request.args.get('sort', 'tree')
+    k = get_int_arg('k')
+
+    if limit == 0:
+        # Pages would never move forward
+        abort(400)
+
+    if sort not in ('tree', 'relevance'):
+        abort(400)
+
+    inner_value, outer_value = split_value(value)
+
+    # The outer query is evaluated once, and gives the total
+    outer_query = build_query(outer_value) if outer_value else None
+    query = build_query(inner_value + ' ' + outer_value)
+
+    # Copy, so that the cached results are not updated
+    if sort == 'relevance':
+        results = dict(ranked_results(SNAPSHOT, query, outer_query,
+                                      RANKED_K if k is None else k))
+        # Pages are only for results in tree order
+        offset = limit = None
     else:
-        nb_total = NB_GRAPHS
+        results = dict(search_results(SNAPSHOT, query, outer_query))
+
+    nb_total = results['nb_total']
+    METRICS.observe('graphdash_search_results', results['nb_matches'], buckets=SIZE_BUCKETS)
 
     ratio = 100 * results['nb_matches'] / float(nb_total) if nb_total != 0 else 0
 
     results.update({
         'inner_value' : inner_value,
         'outer_value' : outer_value,
-        'nb_total'    : nb_total,
         'ratio'       : '{0:.2f}'.format(ratio),
     })
+
+    if offset is not None or limit is not None:
+        offset = offset or 0
+        results.update(paginate(results, offset, limit))
+
+        # Not from the graphs of the page, as there are none in headless mode
+        next_offset = offset + limit if limit is not None else results['nb_matches']
+        results.update({
+            'offset'      : offset,
+            'limit'       : limit,
+            'next_offset' : next_offset if next_offset < results['nb_matches'] else None,
+        })
+
     return jsonify(results)
 
 
-def memoize(function):
-    memo = {}
+@app.route('/search/stream')
+def search_stream():
+    """All matches as JSON lines, in tree order, without buffering them.
+    """
+    inner_value, outer_value = split_value(request.args.get('value', ''))
+    outer_query = build_query(outer_value) if outer_value else None
+    index = SNAPSHOT.index
+    gids, _ = index.search(build_query(inner_value + ' ' + outer_value), outer_query)
+
+    def generate():
+        for gid in gids:
+            graph = index.graph(gid)
+            line = dict(graph.match or {}, family=graph.family_path)
+            yield json.dumps(line, sort_keys=True) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/cache')
+def get_cache_stats():
+    return jsonify({
+        'build_query'   : QUERY_CACHE.stats(),
+        'search_results': RESULTS_CACHE.stats(),
+        'pages'         : PAGE_CACHE.stats(),
+        'markdown'      : MD_CACHE.stats(),
+    })
+
+
+def new_cache(sizeof=approx_sizeof):
+    return LRUCache(max_entries=CONF['cache_entries'],
+                    max_bytes=CONF['cache_bytes'],
+                    ttl=CONF['cache_ttl'],
+                    sizeof=sizeof)
+
+
+def results_sizeof(value):
+    """Search results refer to the graphs of the snapshot index, which
+    are not freed on eviction, so only the containers built for them
+    are counted, in O(number of families)."""
+    if isinstance(value, dict) and 'matches' in value:
+        return (sys.getsizeof(value)
+                + sys.getsizeof(value['matches'])
+                + sum(sys.getsizeof(graphs) for graphs in value['matches'].values())
+                + sys.getsizeof(value['families'])
+                + sys.getsizeof(value['aliases']))
+    return approx_sizeof(value)
+
+
+QUERY_CACHE = new_cache()
+RESULTS_CACHE = new_cache(sizeof=results_sizeof)
+PAGE_CACHE = new_cache()
+
+
+def clear_caches():
+    """To be called when the data tree is reloaded.
+    Queries do not depend on data, so they are kept,
+    and so are markdown texts, keyed on their content.
+    """
+    RESULTS_CACHE.clear()
+    PAGE_CACHE.clear()
 
-    def wrapper(*args):
-        if args not in memo:
-            memo[args] = function(*args)
-        return memo[args]
-    return wrapper
+
+_missing = object()
+
+
+def memoize(cache, key=lambda *args: args):
+    def _memoize(function):
+        @wraps(function)
+        def wrapper(*args):
+            k = key(*args)
+            value = cache.get(k, _missing)
+            if value is _missing:
+                value = function(*args)
+                cache.set(k, value)
+            return value
+        return wrapper
+    return _memoize
 
 
 def quote_aware_split(value):
@@ -265,11 +698,7 @@ def quote_aware_split(value):
     return res
 
 
-Query = namedtuple('Query', ['keywords', 'freetext'])
-Words = namedtuple('Words', ['include', 'exclude'])
-
-
-@memoize
+@memoize(QUERY_CACHE)
 def build_query(value):
     # Building mutable version of query
     q = {
@@ -291,62 +720,172 @@ def build_query(value):
     return Query(**q)
 
 
-def is_in_any(w, args):
-    return any(w in arg for arg in args)
+# Short prefixes match many tags, they are worth caching
+@memoize(RESULTS_CACHE, key=lambda snapshot, *args: (snapshot.version, 'complete') + args)
+def complete_tags(snapshot, prefix, limit=None):
+    return snapshot.completer.complete(prefix, limit)
 
 
-def is_not_in(w, args):
-    return all(w not in arg for arg in args)
-
-
-@memoize
-def search_results(query):
+# Snapshots are cached by version, not to keep old ones alive
+@memoize(RESULTS_CACHE, key=lambda snapshot, *args: (snapshot.version,) + args)
+def search_results(snapshot, query, outer_query=None):
     # Storing results here
     matches = defaultdict(list)
     aliases = {}
-    nb_matches = 0
-
-    for family_tuple, node in DATA.iter_all_nodes():
-        family_path_low = '/'.join(family_tuple).lower()
-        family_alias_low = '/'.join(
-            get(p)['alias'] for p in up_paths(family_tuple, include_root=False)
-        ).lower()
-
-        for graph_data in node.data['graphs']:
-            graph_title_low = graph_data['title'].lower()
-            graph_keywords = set(w.lower() for w in graph_data['index'])
-            # Tuple where the freetext is looked for
-            t = family_path_low, family_alias_low, graph_title_low, graph_keywords
-
-            if (graph_keywords.issuperset(query.keywords.include)
-                    and graph_keywords.isdisjoint(query.keywords.exclude)
-                    and all(is_in_any(w, t) for w in query.freetext.include)
-                    and all(is_not_in(w, t) for w in query.freetext.exclude)):
-
-                nb_matches += 1
-                if CONF['headless']:
-                    continue
-
-                if family_tuple not in matches:
-                    # We want to keep aliases for all parent nodes
-                    # This is needed for links, client-side
-                    for p in up_paths(family_tuple, include_root=False):
-                        aliases['/'.join(p)] = get(p)['alias']
-
-                # matches will be jsonified and tuple keys are not allowed
-                # So we use the path as key
-                family_path = '/'.join(family_tuple)
-
-                matches[family_path].append({
-                    'title' : md_iconvert(graph_data['title']),
-                    'text'  : graph_data['text'],
-                    'labels': sort_labels(graph_data['labels']),
-                    'id'    : graph_data['id'],
-                })
 
-    return {
+    if CONF['headless']:
+        # Only counting, graphs are never looked at
+        nb_matches, nb_total = snapshot.index.count(query, outer_query)
+    else:
+        gids, nb_total = snapshot.index.search(query, outer_query)
+        nb_matches = len(gids)
+
+        for gid in gids:
+            graph = snapshot.index.graph(gid)
+
+            if graph.family_path not in matches:
+                # We want to keep aliases for all parent nodes
+                # This is needed for links, client-side
+                aliases.update(graph.aliases)
+
+            # matches will be jsonified and tuple keys are not allowed
+            # So we use the path as key
+            matches[graph.family_path].append(graph.match)
+
+    results = {
         'matches'   : matches,
         'families'  : sorted(matches, key=lambda s: s.lower()),
         'aliases'   : aliases,
         'nb_matches': nb_matches,
+        'nb_total'  : nb_total,
     }
+
+    if CONF['fuzzy']:
+        # Unknown keywords and the known ones they matched
+        results['expansions'] = snapshot.index.expansions(query)
+    return results
+
+
+@memoize(RESULTS_CACHE, key=lambda snapshot, *args: (snapshot.version, 'ranked') + args)
+def ranked_results(snapshot, query, outer_query=None, k=RANKED_K):
+    ranked = []
+    aliases = {}
+
+    best, nb_matches, nb_total = snapshot.index.search_ranked(query, k, outer_query)
+
+    for gid, score in best:
+        graph = snapshot.index.graph(gid)
+        aliases.update(graph.aliases)
+        ranked.append(dict(graph.match or {}, family=graph.family_path, score=score))
+
+    results = {
+        'ranked'    : ranked,
+        'aliases'   : aliases,
+        'nb_matches': nb_matches,
+        'nb_total'  : nb_total,
+    }
+
+    if CONF['fuzzy']:
+        results['expansions'] = snapshot.index.expansions(query)
+    return results
+
+
+# METRICS
+#
+def start_timer():
+    g.start = time.time()
+
+
+def record_request(response):
+    endpoint = request.endpoint or 'none'
+    METRICS.inc('graphdash_requests_total', endpoint=endpoint, status=response.status_code)
+    METRICS.observe('graphdash_request_seconds', time.time() - g.start, endpoint=endpoint)
+    return response
+
+
+COUNTED_CACHES = [
+    ('build_query', QUERY_CACHE),
+    ('search_results', RESULTS_CACHE),
+    ('pages', PAGE_CACHE),
+    ('markdown', MD_CACHE),
+]
+
+
+def cache_counters():
+    for name, cache_ in COUNTED_CACHES:
+        stats = cache_.stats()
+        yield 'graphdash_cache_hits_total', {'cache': name}, stats['hits']
+        yield 'graphdash_cache_misses_total', {'cache': name}, stats['misses']
+
+
+def reset_cache_counters():
+    """Forked workers count their own hits and misses, not those
+    of the parent, like markdown prewarming, as all are summed."""
+    for _, cache_ in COUNTED_CACHES:
+        cache_.after_fork()
+
+
+def tree_sizes(data):
+    nb_nodes = nb_graphs = 0
+    labels = set()
+
+    for _, node in data.iter_all_nodes():
+        nb_nodes += 1
+        nb_graphs += len(node.data.graphs)
+        labels.update(label.name for label in node.data.labels)
+
+    return {'nodes': nb_nodes, 'graphs': nb_graphs, 'labels': len(labels)}
+
+
+# Sizes only change with the snapshot, and metrics are scraped often
+SIZES_CACHE = LRUCache(max_entries=1)
+
+
+@memoize(SIZES_CACHE, key=lambda snapshot: snapshot.version)
+def snapshot_sizes(snapshot):
+    return tree_sizes(snapshot.data)
+
+
+@app.route('/metrics')
+def get_metrics():
+    if not CONF['metrics']:
+        abort(404)
+
+    snapshot = SNAPSHOT
+    for name, value in snapshot_sizes(snapshot).items():
+        METRICS.set('graphdash_tree_' + name, value)
+    METRICS.set('graphdash_data_version', snapshot.version)
+    return Response(METRICS.expose(), content_type=CONTENT_TYPE)
+
+
+METRICS.add_collector(cache_counters)
+
+if CONF['metrics'] and COMMAND == 'serve':
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    METRICS.start()
+    # Also registered in forked workers
+    atexit.register(METRICS.stop)
+
+    # With gunicorn --preload, workers are forked after loading
+    at_fork(reset_cache_counters)
+    at_fork(METRICS.start)
+
+
+# STARTUP PROFILE
+#
+if PROFILER.enabled:
+    for name, value in tree_sizes(SNAPSHOT.data).items():
+        PROFILER.count(name, value)
+    PROFILER.count('themes', len(THEMES))
+
+    PROFILE = PROFILER.stop(dump=CONF['profile_dump'])
+    show_profile(PROFILE)
+    if CONF['profile_report'] is not None:
+        export_profile(PROFILE, CONF['profile_report'])
+
+
+# SHARING MEMORY
+#
+# Last, so that everything loaded above is frozen
+freeze_objects()
@@ -0,0 +1,803 @@
+# -*- coding: utf-8 -*-
+
+"""
+Search engine, working on indexes built once after loading.
+"""
+
+import re
+import sys
+import math
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from .nlp import StopWords
+
+try:
+    import numpy as np
+except ImportError:
+    # Keyword filtering then relies on the sets of ids only
+    np = None
+
+# Freetext fields are split into tokens on these characters.
+# A query word without any of them is a substring of a field
+# if and only if it is a substring of one of its tokens.
+SEPARATORS = re.compile(r'[\s/]+')
+
+EMPTY = frozenset()
+
+# Pieces shorter than this are looked for by scanning the vocabulary
+NGRAM = 3
+
+
+def split_tokens(string):
+    return [t for t in SEPARATORS.split(string) if t]
+
+
+def iter_ngrams(string, n=NGRAM):
+    for i in range(len(string) - n + 1):
+        yield string[i:i + n]
+
+
+def is_in_any(w, args):
+    return any(w in arg for arg in args)
+
+
+Query = namedtuple('Query', ['keywords', 'freetext'])
+Words = namedtuple('Words', ['include', 'exclude'])
+
+
+def residual(query, outer):
+    """Words of query which are not in outer. None if some words of outer
+    are not in query, in which case query matches are not all outer matches.
+    """
+    groups = []
+    for words, outer_words in zip(query, outer):
+        if not (outer_words.include <= words.include
+                and outer_words.exclude <= words.exclude):
+            return None
+        groups.append(Words(include=words.include - outer_words.include,
+                            exclude=words.exclude - outer_words.exclude))
+    return Query(*groups)
+
+
+# Keywords found in at least 1 graph out of DENSITY get a precomputed
+# bitset, the others are packed from their ids when queried
+DENSITY = 256
+
+
+class KeywordBitsets(object):
+    """Packed bit arrays over graph ids, for keywords set algebra."""
+
+    def __init__(self, keywords, size, density=DENSITY):
+        self._keywords = keywords  # keyword -> ids
+        self._size = size
+        self._all = self._pack(range(size))
+        self._dense = dict((kw, self._pack(gids))
+                           for kw, gids in keywords.items()
+                           if len(gids) * density >= size)
+        # Number of bits set for each byte value
+        self._popcount = np.unpackbits(
+            np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1)
+
+    def __len__(self):
+        return len(self._dense)
+
+    def _pack(self, gids):
+        mask = np.zeros(self._size, dtype=bool)
+        mask[np.fromiter(gids, dtype=np.intp, count=len(gids))] = True
+        return np.packbits(mask)
+
+    def get(self, kw, postings=None):
+        bits = self._dense.get(kw)
+        if bits is None:
+            gids = postings(kw) if postings is not None else self._keywords.get(kw, EMPTY)
+            bits = self._pack(gids)
+        return bits
+
+    def select(self, keywords, within=None, postings=None):
+        """Bits of graphs with all keywords.include and no keywords.exclude,
+        among the bits of within if given. Ids of graphs of included
+        keywords are given by postings if given.
+        """
+        bits = (self._all if within is None else within).copy()
+        for kw in keywords.include:
+            np.bitwise_and(bits, self.get(kw, postings), out=bits)
+        for kw in keywords.exclude:
+            # Padding bits are already cleared in bits, so inverting is safe
+            np.bitwise_and(bits, np.invert(self.get(kw)), out=bits)
+        return bits
+
+    def count(self, bits):
+        return int(self._popcount[bits].sum())
+
+    def ids(self, bits):
+        """Sorted ids of bits set."""
+        return np.flatnonzero(np.unpackbits(bits, count=self._size)).tolist()
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b: insertions,
+    deletions, substitutions and transpositions of adjacent characters.
+    Any distance above limit is returned as limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # Common prefix and suffix do not change the distance,
+    # and typos usually leave only a few characters
+    start, end = 0, 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    while (end < len(a) - start and end < len(b) - start
+           and a[-1 - end] == b[-1 - end]):
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+
+    return min(current[-1], limit + 1)
+
+
+def iter_deletes(word, distance):
+    """word, and all strings made by deleting up to distance characters."""
+    seen = {word}
+    edge = [word]
+    for _ in range(distance):
+        edge = [w[:i] + w[i + 1:] for w in edge for i in range(len(w))]
+        edge = [w for w in edge if w not in seen and not seen.add(w)]
+    return seen
+
+
+class FuzzyKeywords(object):
+    """Known words within a small edit distance of other words.
+
+    This is a symmetric delete dictionary: words are indexed under all
+    the strings made by deleting up to max_distance characters of their
+    prefix, so that a lookup only computes deletes of the looked up
+    word, and checks the distance to the few words sharing one.
+    """
+
+    def __init__(self, words, max_distance=1, prefix_length=7):
+        self.max_distance = max_distance
+        self._prefix_length = prefix_length
+        self._words = sorted(words)
+        self._deletes = {}  # delete -> word id, or tuple of word ids
+
+        for wid, word in enumerate(self._words):
+            for delete in iter_deletes(word[:prefix_length], max_distance):
+                wids = self._deletes.get(delete)
+                if wids is None:
+                    self._deletes[delete] = wid
+                elif isinstance(wids, tuple):
+                    self._deletes[delete] = wids + (wid,)
+                else:
+                    self._deletes[delete] = (wids, wid)
+
+    def __len__(self):
+        return len(self._deletes)
+
+    def lookup(self, word):
+        """Closest known words, sorted, if within max_distance of word."""
+        candidates = set()
+        for delete in iter_deletes(word[:self._prefix_length], self.max_distance):
+            wids = self._deletes.get(delete)
+            if wids is None:
+                continue
+            if isinstance(wids, tuple):
+                candidates.update(wids)
+            else:
+                candidates.add(wids)
+
+        # Candidates of close lengths first, as they are the most likely
+        # to be close, and any closer one lowers the distance to check
+        closest, best = [], self.max_distance
+        candidates = sorted((abs(len(self._words[wid]) - len(word)), wid) for wid in candidates)
+
+        for length_diff, wid in candidates:
+            if length_diff > best:
+                break
+            candidate = self._words[wid]
+            distance = edit_distance(word, candidate, best)
+            if distance < best:
+                closest, best = [candidate], distance
+            elif distance == best:
+                closest.append(candidate)
+        return sorted(closest)
+
+
+# Markdown syntax removed from texts before splitting them into words,
+# each regexp being only applied to texts having its marker
+MARKDOWN_SYNTAX = [
+    # Links and images, keeping their text, and link references
+    ('](', re.compile(r'!?\[([^\]]*)\]\([^)]*\)'), r' \1 '),
+    (']:', re.compile(r'(?m)^ {0,3}\[[^\]]+\]:.*$'), ' '),
+    # Code fences and their language
+    ('``', re.compile(r'(?m)^ {0,3}`{3,}.*$'), ' '),
+    ('~~', re.compile(r'(?m)^ {0,3}~{3,}.*$'), ' '),
+    # Html tags and urls
+    ('<', re.compile(r'</?[a-zA-Z][^>]*>'), ' '),
+    ('://', re.compile(r'\b(https?|ftp)://\S+'), ' '),
+]
+
+# Words of texts, anything else like emphasis or headers is ignored
+TEXT_WORD = re.compile(r'[^\W_]+')
+
+STOP_WORDS = frozenset(StopWords('english'))
+
+
+def strip_markdown(text):
+    for marker, regexp, replacement in MARKDOWN_SYNTAX:
+        if marker in text:
+            text = regexp.sub(replacement, text)
+    return text
+
+
+def text_words(text):
+    """Lowercased words of a markdown text, stop words being None:
+    they are skipped but counted, so that a phrase only matches texts
+    where its words are as far from each other."""
+    return [None if w in STOP_WORDS else w
+            for w in TEXT_WORD.findall(strip_markdown(text).lower())]
+
+
+class FullTextIndex(object):
+    """Positional inverted index over the texts of graphs.
+
+    Graphs with the same texts share a document. Postings are kept in
+    flat arrays: the entries of a word are a slice of the documents
+    having it, and the entry of a document a slice of positions.
+    """
+
+    # Position gap between texts of a document, so that phrases never span two
+    GAP = 100
+
+    def __init__(self, texts):
+        """texts gives for each graph id a tuple of texts, searched as one."""
+        documents = {}       # texts -> document id
+        document_gids = []   # document id -> graph ids
+        # word -> (document ids, end of their positions, positions), flat
+        # lists rather than an object per entry, which the garbage collector
+        # would keep scanning
+        postings = {}
+
+        for gid, graph_texts in enumerate(texts):
+            if not any(graph_texts):
+                continue
+            did = documents.get(graph_texts)
+            if did is None:
+                did = documents[graph_texts] = len(document_gids)
+                document_gids.append([])
+
+                words = []
+                for text in graph_texts:
+                    if words:
+                        words.extend([None] * self.GAP)
+                    words.extend(text_words(text))
+
+                positions = {}
+                for position, word in enumerate(words):
+                    if word is not None:
+                        word_positions = positions.get(word)
+                        if word_positions is None:
+                            positions[word] = [position]
+                        else:
+                            word_positions.append(position)
+
+                for word, word_positions in positions.items():
+                    word_postings = postings.get(word)
+                    if word_postings is None:
+                        word_postings = postings[word] = ([], [], [])
+                    word_postings[0].append(did)
+                    word_postings[2].extend(word_positions)
+                    word_postings[1].append(len(word_postings[2]))
+
+            document_gids[did].append(gid)
+
+        self._words = {}
+        word_starts, entry_docs, entry_starts, all_positions = [0], [], [0], []
+
+        for wid, word in enumerate(sorted(postings)):
+            self._words[sys.intern(word)] = wid
+            dids, ends, word_positions = postings[word]
+            offset = len(all_positions)
+            entry_docs.extend(dids)
+            entry_starts.extend(offset + end for end in ends)
+            all_positions.extend(word_positions)
+            word_starts.append(len(entry_docs))
+
+        doc_starts, doc_gids = [0], []
+        for gids in document_gids:
+            doc_gids.extend(gids)
+            doc_starts.append(len(doc_gids))
+
+        # Unsigned ints of 4 bytes, entries of a word being by document id
+        self._word_starts = array('I', word_starts)
+        self._entry_docs = array('I', entry_docs)
+        self._entry_starts = array('I', entry_starts)
+        self._positions = array('I', all_positions)
+        self._doc_starts = array('I', doc_starts)
+        self._doc_gids = array('I', doc_gids)
+
+    def __len__(self):
+        return len(self._words)
+
+    def _arrays(self):
+        return (self._word_starts, self._entry_docs, self._entry_starts,
+                self._positions, self._doc_starts, self._doc_gids)
+
+    def stats(self):
+        nbytes = sys.getsizeof(self._words) + sum(sys.getsizeof(w) for w in self._words)
+        nbytes += sum(a.itemsize * len(a) for a in self._arrays())
+        return {
+            'documents': len(self._doc_starts) - 1,
+            'words'    : len(self._words),
+            'postings' : len(self._entry_docs),
+            'positions': len(self._positions),
+            'bytes'    : nbytes,
+        }
+
+    def _entries(self, wid):
+        return range(self._word_starts[wid], self._word_starts[wid + 1])
+
+    def _entry_positions(self, entry):
+        return self._positions[self._entry_starts[entry]:self._entry_starts[entry + 1]]
+
+    def _entry(self, wid, did):
+        """Entry of a document among those of a word, which has it."""
+        entries = self._entries(wid)
+        return bisect_left(self._entry_docs, did, entries.start, entries.stop)
+
+    def _has_phrase(self, did, phrase):
+        """Whether a document has all the (offset, word id) of phrase,
+        at these offsets from a same position."""
+        (first_offset, first_wid), others = phrase[0], phrase[1:]
+        starts = set(p - first_offset for p in
+                     self._entry_positions(self._entry(first_wid, did)))
+        for offset, wid in others:
+            starts.intersection_update(p - offset for p in
+                                       self._entry_positions(self._entry(wid, did)))
+            if not starts:
+                return False
+        return True
+
+    def search(self, text):
+        """Ids of graphs whose texts have all the words of text, as a
+        phrase if several. Text made of stop words only matches nothing.
+        """
+        phrase = []
+        for offset, word in enumerate(text_words(text)):
+            if word is None:
+                continue
+            wid = self._words.get(word)
+            if wid is None:
+                return EMPTY
+            phrase.append((offset, wid))
+
+        if not phrase:
+            return EMPTY
+
+        # Rarest words first
+        phrase.sort(key=lambda p: len(self._entries(p[1])))
+        dids = None
+        for _, wid in phrase:
+            entries = self._entries(wid)
+            docs = self._entry_docs[entries.start:entries.stop]
+            dids = set(docs) if dids is None else dids.intersection(docs)
+            if not dids:
+                return EMPTY
+
+        if len(phrase) > 1:
+            dids = [did for did in dids if self._has_phrase(did, phrase)]
+
+        gids = set()
+        for did in dids:
+            gids.update(self._doc_gids[self._doc_starts[did]:self._doc_starts[did + 1]])
+        return gids
+
+
+# BM25 parameters, and boosts of the fields of graphs when ranking:
+# family path and aliases, title, keywords, as in Projection fields
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_BOOSTS = (1.0, 3.0, 2.0)
+
+
+def bm25_idf(nb_docs, nb_matches):
+    return math.log(1.0 + (nb_docs - nb_matches + 0.5) / (nb_matches + 0.5))
+
+
+# Read-only view of a graph, holding everything search needs:
+# fields      : tuple where the freetext is looked for
+# family_path : key of the graph family in search results
+# aliases     : (path, alias) of all the family parents, for client-side links
+# match       : graph as returned in search results, None if not rendered
+Projection = namedtuple('Projection', ['fields', 'family_path', 'aliases', 'match'])
+
+
+class SearchIndex(object):
+    """Inverted index over all graphs of the tree.
+
+    Graphs are identified by their position in the tree iteration order,
+    so sorting a set of ids gives back the order of a full tree scan.
+    """
+
+    def __init__(self, data, match=None, fuzzy=0, fulltext=False):
+        """match builds the graph as returned in search results,
+        if None the search results cannot be rendered.
+        With fuzzy, unknown included keywords match the closest known
+        keywords, within this edit distance.
+        With fulltext, freetext words are also looked for as words
+        of the pretext and text of graphs.
+        """
+        self._graphs = []  # id -> Projection
+        keywords = defaultdict(set)
+        tokens = defaultdict(set)
+        texts = []  # id -> (pretext, text)
+        # id -> number of tokens of family path and aliases, title, keywords
+        lengths = tuple(array('I') for _ in FIELD_BOOSTS)
+
+        for family_tuple, node in data.iter_all_nodes():
+            up_paths = list(data.iter_upper_paths(family_tuple, include_root=False))
+            up_aliases = [data.get_from_path(p).data['alias'] for p in up_paths]
+
+            family_path = '/'.join(family_tuple)
+            family_path_low = family_path.lower()
+            family_alias_low = '/'.join(up_aliases).lower()
+            aliases = tuple(('/'.join(p), a) for p, a in zip(up_paths, up_aliases))
+
+            family_tokens = set(split_tokens(family_path_low))
+            family_tokens.update(split_tokens(family_alias_low))
+
+            for graph_data in node.data.graphs:
+                gid = len(self._graphs)
+                graph_title_low = graph_data.title.lower()
+                graph_keywords = frozenset(sys.intern(w.lower()) for w in graph_data.index)
+
+                self._graphs.append(Projection(
+                    fields=(family_path_low, family_alias_low, graph_title_low, graph_keywords),
+                    family_path=family_path,
+                    aliases=aliases,
+                    match=match(graph_data) if match is not None else None,
+                ))
+
+                if fulltext:
+                    texts.append((graph_data.pretext, graph_data.text))
+
+                graph_title_tokens = split_tokens(graph_title_low)
+                lengths[0].append(len(family_tokens))
+                lengths[1].append(len(graph_title_tokens))
+                lengths[2].append(len(graph_keywords))
+
+                for kw in graph_keywords:
+                    keywords[kw].add(gid)
+                for token in family_tokens.union(graph_title_tokens):
+                    tokens[token].add(gid)
+
+        self._all = frozenset(range(len(self._graphs)))
+        self._lengths = lengths
+        self._avg_lengths = tuple(sum(a) / float(len(a)) if a else 0.0 for a in lengths)
+        self._keywords = dict((k, frozenset(v)) for k, v in keywords.items())
+        self._tokens = dict((t, frozenset(v)) for t, v in tokens.items())
+
+        # Trigram index over the vocabulary of the freetext fields,
+        # so that substrings are found without scanning all tokens
+        self._vocabulary = sorted(self._tokens)
+        ngrams = defaultdict(set)
+
+        for tid, token in enumerate(self._vocabulary):
+            for ngram in iter_ngrams(token):
+                ngrams[ngram].add(tid)
+
+        self._ngrams = dict((g, frozenset(v)) for g, v in ngrams.items())
+
+        if np is not None:
+            self._bitsets = KeywordBitsets(self._keywords, len(self._graphs))
+        else:
+            self._bitsets = None
+
+        if fuzzy:
+            self._fuzzy = FuzzyKeywords([kw[1:] for kw in self._keywords], max_distance=fuzzy)
+        else:
+            self._fuzzy = None
+
+        self._fulltext = FullTextIndex(texts) if fulltext else None
+
+    def __len__(self):
+        return len(self._graphs)
+
+    def stats(self):
+        return {
+            'graphs'  : len(self._graphs),
+            'keywords': len(self._keywords),
+            'tokens'  : len(self._tokens),
+            'ngrams'  : len(self._ngrams),
+            'bitsets' : len(self._bitsets) if self._bitsets is not None else 0,
+            'deletes' : len(self._fuzzy) if self._fuzzy is not None else 0,
+        }
+
+    def fulltext_stats(self):
+        """Sizes of the full-text index, None if disabled."""
+        return self._fulltext.stats() if self._fulltext is not None else None
+
+    def graph(self, gid):
+        """Return the Projection of a graph id."""
+        return self._graphs[gid]
+
+    def expand(self, kw):
+        """Known keywords replacing kw in fuzzy mode, empty if kw is known."""
+        if self._fuzzy is None or kw in self._keywords:
+            return []
+        return ['#' + w for w in self._fuzzy.lookup(kw[1:])]
+
+    def expansions(self, query):
+        """Unknown included keywords of query, with their replacements."""
+        expansions = {}
+        for kw in query.keywords.include:
+            expanded = self.expand(kw)
+            if expanded:
+                expansions[kw] = expanded
+        return expansions
+
+    def _postings(self, kw):
+        """Ids of graphs with kw, or in fuzzy mode with any of its replacements."""
+        gids = self._keywords.get(kw)
+        if gids is not None:
+            return gids
+        return frozenset().union(*(self._keywords[e] for e in self.expand(kw)))
+
+    def _candidate_tokens(self, piece):
+        """Tokens which may contain piece."""
+        if len(piece) < NGRAM:
+            return self._vocabulary
+
+        tids = None
+        for ngram in sorted(set(iter_ngrams(piece)),
+                            key=lambda g: len(self._ngrams.get(g, EMPTY))):
+            postings = self._ngrams.get(ngram, EMPTY)
+            tids = postings if tids is None else tids.intersection(postings)
+            if not tids:
+                return []
+
+        return [self._vocabulary[tid] for tid in tids]
+
+    def _containing(self, piece):
+        """Ids of graphs having a token containing piece."""
+        gids = set()
+        for token in self._candidate_tokens(piece):
+            if piece in token:
+                gids.update(self._tokens[token])
+        return gids
+
+    def _freetext(self, w, candidates):
+        """Ids of graphs where w is found in one of the freetext fields,
+        or in their texts with the full-text index.
+        """
+        gids = self._fields(w, candidates)
+        if self._fulltext is not None:
+            gids = gids.union(self._fulltext.search(w))
+        return gids
+
+    def _fields(self, w, candidates):
+        """Ids of graphs where w is found in one of the freetext fields.
+        Only candidates may be checked on the fields.
+        """
+        pieces = split_tokens(w)
+
+        if pieces == [w]:
+            # No separator, the token postings give the exact answer
+            return self._keywords.get(w, EMPTY).union(self._containing(w))
+
+        # Otherwise all pieces must be found, and survivors are checked
+        for piece in pieces:
+            candidates = candidates.intersection(self._containing(piece))
+
+        return self._keywords.get(w, EMPTY).union(
+            gid for gid in candidates if is_in_any(w, self._graphs[gid].fields))
+
+    def _select_keywords(self, keywords, within):
+        """Ids of graphs matching the keywords part of a query, among within."""
+        if not any(keywords):
+            return within
+
+        if self._bitsets is not None and within is self._all:
+            bits = self._bitsets.select(keywords, postings=self._postings)
+            return frozenset(self._bitsets.ids(bits))
+
+        gids = within
+
+        # Starting with the smallest posting lists keeps intersections cheap
+        for postings in sorted((self._postings(kw) for kw in keywords.include), key=len):
+            gids = gids.intersection(postings)
+
+        for kw in keywords.exclude:
+            gids = gids.difference(self._keywords.get(kw, EMPTY))
+
+        return gids
+
+    def _match(self, query, within=None):
+        """Ids of graphs matching the query, among within if given."""
+        gids = self._select_keywords(query.keywords, self._all if within is None else within)
+
+        for w in query.freetext.include:
+            if not gids:
+                break
+            gids = gids.intersection(self._freetext(w, gids))
+
+        for w in query.freetext.exclude:
+            if not gids:
+                break
+            gids = gids.difference(self._freetext(w, gids))
+
+        return gids
+
+    def _on_bitsets(self, query, outer):
+        """Whether keywords bitsets are enough to answer."""
+        return (self._bitsets is not None
+                and not any(query.freetext)
+                and (outer is None or not any(outer.freetext)))
+
+    def _search_bits(self, query, outer):
+        postings = self._postings
+        if outer is None:
+            return self._bitsets.select(query.keywords, postings=postings), len(self._graphs)
+
+        outer_bits = self._bitsets.select(outer.keywords, postings=postings)
+        inner = residual(query, outer)
+        if inner is None:
+            bits = self._bitsets.select(query.keywords, postings=postings)
+        else:
+            bits = self._bitsets.select(inner.keywords, within=outer_bits, postings=postings)
+        return bits, self._bitsets.count(outer_bits)
+
+    def _search_sets(self, query, outer):
+        if outer is None:
+            return self._match(query), len(self._graphs)
+
+        outer_gids = self._match(outer)
+        inner = residual(query, outer)
+        if inner is None:
+            gids = self._match(query)
+        else:
+            gids = self._match(inner, within=outer_gids)
+        return gids, len(outer_gids)
+
+    def search(self, query, outer=None):
+        """Sorted ids of graphs matching query, and the number of graphs
+        matching outer, all graphs if outer is None. When query contains
+        outer, only its remaining words are evaluated on outer matches.
+        """
+        if self._on_bitsets(query, outer):
+            bits, nb_total = self._search_bits(query, outer)
+            return self._bitsets.ids(bits), nb_total
+
+        gids, nb_total = self._search_sets(query, outer)
+        return sorted(gids), nb_total
+
+    def _scorer(self, query):
+        """Function giving the BM25 score of a graph id for the included
+        words of query, fields being scored apart and weighted.
+        Keywords are only looked for in the keywords field, freetext words
+        are counted as substrings, as they are matched.
+        """
+        nb_graphs = len(self._graphs)
+        lengths = self._lengths
+
+        # Sorted, so that scores are summed the same in all processes
+        keywords = [([kw] + self.expand(kw), bm25_idf(nb_graphs, len(self._postings(kw))))
+                    for kw in sorted(query.keywords.include)]
+        words = [(w, bm25_idf(nb_graphs, len(self._freetext(w, self._all))))
+                 for w in sorted(query.freetext.include)]
+
+        def weight(f, idf, tf, length):
+            avg = self._avg_lengths[f]
+            norm = BM25_K1 * (1 - BM25_B + (BM25_B * length / avg if avg else 0.0))
+            return FIELD_BOOSTS[f] * idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        # Graphs of a family share the score of its path and aliases
+        families = {}
+
+        def score(gid):
+            graph = self._graphs[gid]
+            family_path, family_alias, title, graph_keywords = graph.fields
+
+            # Lowercased paths of families differing by case are equal
+            total = families.get(graph.family_path)
+            if total is None:
+                total = families[graph.family_path] = sum(
+                    weight(0, idf, tf, lengths[0][gid]) for w, idf in words
+                    for tf in [family_path.count(w) + family_alias.count(w)] if tf)
+
+            for w, idf in words:
+                tf = title.count(w)
+                if tf:
+                    total += weight(1, idf, tf, lengths[1][gid])
+                tf = sum(1 for kw in graph_keywords if w in kw)
+                if tf:
+                    total += weight(2, idf, tf, lengths[2][gid])
+
+            for looked_for, idf in keywords:
+                tf = sum(1 for kw in looked_for if kw in graph_keywords)
+                if tf:
+                    total += weight(2, idf, tf, lengths[2][gid])
+            return total
+
+        return score
+
+    def search_ranked(self, query, k, outer=None):
+        """The k best (id, score) of graphs matching query, the number
+        of matches, and the number of graphs matching outer as in search.
+        Equal scores are in tree order.
+        """
+        gids, nb_total = self.search(query, outer)
+        score = self._scorer(query)
+
+        # A heap of k graphs, rather than sorting all of them
+        best = heapq.nlargest(k, ((score(gid), -gid) for gid in gids))
+        return [(-neg_gid, s) for s, neg_gid in best], len(gids), nb_total
+
+    def count(self, query, outer=None):
+        """Same as search, but only counting matches."""
+        if self._on_bitsets(query, outer):
+            bits, nb_total = self._search_bits(query, outer)
+            return self._bitsets.count(bits), nb_total
+
+        gids, nb_total = self._search_sets(query, outer)
+        return len(gids), nb_total
+
+
+class TagCompleter(object):
+    """Tags starting with a prefix, case insensitive, the most frequent
+    first. Keywords are also found without their #.
+
+    Keys are kept in a sorted array, so a prefix is a slice found by
+    bisection.
+    """
+
+    # Greater than any character following a prefix
+    LAST = u'\U0010ffff'
+
+    def __init__(self, tags, weights=None):
+        weights = weights or {}
+        self._tags = list(tags)
+        self._weights = array('l', [weights.get(t, 0) for t in self._tags])
+
+        entries = []
+        for i, tag in enumerate(self._tags):
+            key = tag.lower()
+            entries.append((key, i))
+            if key.startswith('#'):
+                entries.append((key[1:], i))
+        entries.sort()
+
+        self._keys = [k for k, _ in entries]
+        self._ids = array('l', [i for _, i in entries])
+
+    def __len__(self):
+        return len(self._tags)
+
+    def complete(self, prefix, limit=None):
+        prefix = prefix.lower()
+        start = bisect_left(self._keys, prefix)
+        stop = bisect_left(self._keys, prefix + self.LAST, start)
+        ids = set(self._ids[start:stop])
+
+        # Ties are in the order of tags
+        def rank(i):
+            return -self._weights[i], i
+
+        if limit is None:
+            ids = sorted(ids, key=rank)
+        else:
+            ids = heapq.nsmallest(limit, ids, key=rank)
+        return [self._tags[i] for i in ids]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bounded LRU cache, safe to share between threads.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+_sentinel = object()
+
+
+def approx_sizeof(obj):
+    """Approximate memory footprint of obj, following containers."""
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(approx_sizeof(k) + approx_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_sizeof(e) for e in obj)
+
+    return size
+
+
+class LRUCache(object):
+    """Least recently used entries are evicted first when either
+    max_entries or max_bytes is exceeded. Entries older than ttl
+    seconds are considered missing. None means no limit.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None, sizeof=approx_sizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expiration)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _sentinel, count=False) is not _sentinel
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[2] is not None and entry[2] < monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self._sizeof(key) + self._sizeof(value)
+        expiration = monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+
+            self._entries[key] = value, size, expiration
+            self._bytes += size
+
+            while ((self.max_entries is not None and len(self._entries) > self.max_entries)
+                   or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def after_fork(self):
+        """In forked processes, entries are kept but counters start
+        from 0, and the lock is new, as a thread of the parent may
+        have held it."""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries'    : len(self._entries),
+                'bytes'      : self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes'  : self.max_bytes,
+                'ttl'        : self.ttl,
+                'hits'       : self.hits,
+                'misses'     : self.misses,
+                'evictions'  : self.evictions,
+            }
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+
+
+class Record(object):
+    """
+    This is a compact alternative to SemiFrozenDict, when the
+    keys are known beforehand: values are stored in slots.
+
+    Like SemiFrozenDict, new keys are blocked, but existing
+    keys may be modified. Keys are also attributes, so that
+    templates can use record.key as they did with dicts.
+
+    Subclasses define _fields, and __slots__ with at least _fields.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+
+        # Records are always built with all their fields
+        for key in self._fields:
+            if key not in values:
+                raise TypeError('Missing field "{0}" in {1}'.format(
+                    key, self.__class__.__name__))
+            object.__setattr__(self, key, values.pop(key))
+
+        for key in values:
+            self[key] = values[key]
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            object.__setattr__(self, key, value)
+        else:
+            # Addition DENIED
+            print(('(!) Preventing addition of new key "{0}" in dict, '
+                   'authorized keys are {1}').format(key, list(self._fields)))
+
+    def update(self, *args, **kwargs):
+        dict_ = dict(*args, **kwargs)
+        for k in dict_:
+            self[k] = dict_[k]
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return [getattr(self, k) for k in self._fields]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self._fields]
+
+    def copy(self):
+        return self.__class__(self.items())
+
+    def __eq__(self, other):
+        if self.__class__ is not other.__class__:
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    # Mutable, like dicts
+    __hash__ = None
+
+    def __repr__(self):
+        # Like SemiFrozenDict, for messages
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        # Only fields are pickled, not other slots like caches
+        return self.__class__, (self.items(),)
@@ -29,3 +29,7 @@ class SemiFrozenDict(dict):
         dict_ = dict(*args, **kwargs)
         for k in dict_:
             self[k] = dict_[k]
+
+    def __reduce__(self):
+        # Default pickling would add keys one by one, which is denied
+        return self.__class__, (dict(self),)
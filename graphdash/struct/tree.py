@@ -6,33 +6,42 @@ Tree implementation.
 
 
 class Tree(object):
-    __slots__ = ['sons', 'parent', 'data', '__factory']
+    """Nodes know their path from the root, and the root keeps
+    an index of all nodes by path, shared by all nodes.
+    """
+    __slots__ = ['sons', 'parent', 'data', 'path', '_index', '__factory']
 
-    def __init__(self, factory=dict):
+    def __init__(self, factory=dict, parent=None, name=None):
         self.data = factory()
         self.__factory = factory
         self.sons = {}
-        self.parent = None
+        self.parent = parent
 
-    def create_from_path(self, path):
-        if not path:
-            return self
-        first, others = path[0], path[1:]
-        if first not in self.sons:
-            self.sons[first] = Tree(factory=self.__factory)
-            self.sons[first].parent = self
+        if parent is None:
+            self.path = ()
+            self._index = {}
+        else:
+            self.path = parent.path + (name,)
+            self._index = parent._index
+            parent.sons[name] = self
 
-        return self.sons[first].create_from_path(others)
+        self._index[self.path] = self
 
-    def get_from_path(self, path):
-        if not path:
-            return self
+    def create_from_path(self, path):
+        node = self.get_from_path(path)
+        if node is not None:
+            return node
 
-        first, others = path[0], path[1:]
-        if first not in self.sons:
-            return
+        node = self
+        for name in path:
+            son = node.sons.get(name)
+            node = son if son is not None else Tree(self.__factory, node, name)
+        return node
 
-        return self.sons[first].get_from_path(others)
+    def get_from_path(self, path):
+        if not isinstance(path, tuple):
+            path = tuple(path)
+        return self._index.get(self.path + path if self.path else path)
 
     @staticmethod
     def iter_upper_paths(path, include_root=True):
@@ -42,17 +51,26 @@ class Tree(object):
             yield path[:i]
 
     def iter_all_parents(self):
-        if self.parent is not None:
-            yield self.parent
-            for parent in self.parent.iter_all_parents():
-                yield parent
+        parent = self.parent
+        while parent is not None:
+            yield parent
+            parent = parent.parent
 
     def iter_all_nodes(self, path=()):
-        yield path, self
-        for son_name in self.sons:
-            son = self.sons[son_name]
-            for node_path, node in son.iter_all_nodes(path + (son_name,)):
-                yield node_path, node
+        """Depth-first, parents before their sons."""
+        start = len(self.path)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            # Paths are relative to self, prefixed with path
+            if path == self.path:
+                yield node.path, node
+            else:
+                yield path + node.path[start:], node
+            # Sons are read after yielding, so sons added meanwhile are visited
+            sons = list(node.sons.values())
+            sons.reverse()
+            stack.extend(sons)
 
     def __prettify(self, decorate, with_data, sort_sons, index, name, indent):
         """Recursive pretty printer.
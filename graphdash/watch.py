@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Watching metadata files, to reload data when they change.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path as op
+import threading
+import traceback
+
+from .load import iter_all_files, check_ext
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    # Changes are then detected by polling modification times
+    INotify = None
+
+
+class Watcher(object):
+    """Call callback from a daemon thread when files with some extensions
+    under root, or some other files, are created, modified or removed.
+    """
+
+    def __init__(self, root, callback, extensions, others=(), interval=2.0):
+        self._root = root
+        self._callback = callback
+        self._extensions = [e.lower() for e in extensions]
+        self._others = [op.realpath(p) for p in others if p]
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='graphdash-watcher')
+        self._thread.daemon = True
+
+    @property
+    def thread(self):
+        return self._thread
+
+    @property
+    def mode(self):
+        return 'inotify' if INotify is not None else 'polling'
+
+    def start(self):
+        self._thread.start()
+        print('( ) Watching {0} for changes ({1})'.format(self._root, self.mode))
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _notify(self):
+        try:
+            self._callback()
+        except Exception:
+            # The thread must survive, the current data is kept
+            print('(!) Reload failed, keeping current data')
+            traceback.print_exc()
+
+    def _run(self):
+        if INotify is not None:
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    # Polling
+    #
+    def _signature(self):
+        """Size and modification time of all watched files."""
+        signature = {}
+        paths = list(iter_all_files(self._root, self._extensions))
+
+        for filepath in paths + self._others:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                # Removed in the meantime
+                continue
+            signature[filepath] = st.st_size, st.st_mtime_ns
+
+        return signature
+
+    def _run_polling(self):
+        last = self._signature()
+
+        while not self._stopped.wait(self._interval):
+            current = self._signature()
+            if current != last:
+                last = current
+                self._notify()
+
+    # Inotify
+    #
+    def _add_watches(self, inotify, mask):
+        dirs = set(op.dirname(p) for p in self._others)
+        for root, _, _ in os.walk(self._root, followlinks=True):
+            dirs.add(root)
+
+        for d in dirs:
+            try:
+                inotify.add_watch(d, mask)
+            except OSError:
+                continue
+
+    def _is_relevant(self, event):
+        if event.mask & flags.ISDIR:
+            return True
+        if check_ext(event.name, self._extensions):
+            return True
+        return any(op.basename(p) == event.name for p in self._others)
+
+    def _run_inotify(self):
+        inotify = INotify()
+        mask = (flags.CLOSE_WRITE | flags.CREATE | flags.DELETE
+                | flags.MOVED_FROM | flags.MOVED_TO)
+        self._add_watches(inotify, mask)
+        timeout = int(1000 * self._interval)
+
+        while not self._stopped.is_set():
+            events = inotify.read(timeout=timeout)
+            if not any(self._is_relevant(e) for e in events):
+                continue
+
+            # Waiting for changes to settle, like many files being copied
+            while inotify.read(timeout=timeout):
+                pass
+
+            # New directories must be watched too
+            self._add_watches(inotify, mask)
+            self._notify()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path as op
+import random
+import sys
+
+import pytest
+
+# graphdash builds its app when imported, from the command line
+# and the CONF variable, so it is imported on the test data
+os.environ.setdefault('CONF', op.join(op.dirname(op.abspath(__file__)), 'test.yaml'))
+sys.argv[1:] = []
+
+WORDS = ['alpha', 'beta', 'Gamma', 'delta', 'dé', 'cpu', 'load', 'a0', 'x/y', 'Mu']
+
+
+def random_tree(rng, nb_graphs=300, words=WORDS):
+    """Tree of random families, aliases, titles and keywords."""
+    from graphdash.defaults import default_family_data, default_graph_data
+    from graphdash.load import post_load
+    from graphdash.struct.tree import Tree
+
+    data = Tree(factory=default_family_data)
+
+    for _ in range(nb_graphs):
+        family_tuple = tuple(rng.choice(words[:5]) + str(rng.randrange(3))
+                             for _ in range(rng.randrange(1, 4)))
+        node = data.create_from_path(family_tuple)
+        if rng.random() < 0.3:
+            node.data['alias'] = ' '.join(rng.sample(words, 2))
+
+        graph_data = default_graph_data()
+        graph_data.update({
+            'title': ' '.join(rng.sample(words, rng.randrange(1, 4))),
+            'index': rng.sample(words, rng.randrange(0, 4)),
+        })
+        node.data['graphs'].append(graph_data)
+
+    post_load(data)
+    return data
+
+
+@pytest.fixture
+def rng():
+    return random.Random(42)
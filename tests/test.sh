@@ -44,9 +44,15 @@ sleep 3
 echo -e "\n> Testing"
 assert_code 302 "http://$BIND/"
 assert_code 200 "http://$BIND/tags"
+assert_code 200 "http://$BIND/tags/complete?prefix=c&limit=5"
 assert_code 200 "http://$BIND/family/"
 assert_code 200 "http://$BIND/family/cat"
 assert_code 200 "http://$BIND/search?value=*"
 assert_code 200 "http://$BIND/search?value=find"
+assert_code 200 "http://$BIND/search?value=find&offset=0&limit=10"
+assert_code 200 "http://$BIND/search?value=find&sort=relevance&k=5"
+assert_code 400 "http://$BIND/search?value=find&sort=nonexistent"
+assert_code 200 "http://$BIND/search/stream?value=*"
+assert_code 200 "http://$BIND/cache"
 assert_code 404 "http://$BIND/nonexistent"
 
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from graphdash.defaults import default_family_data, default_graph_data
+from graphdash.load import COMPILED_CONF_KEYS, export_compiled, load_compiled
+from graphdash.routes import build_query
+from graphdash.search import SearchIndex, TagCompleter
+from graphdash.struct.tree import Tree
+
+CONF = dict((k, None) for k in COMPILED_CONF_KEYS)
+
+
+def deep_tree(depth):
+    """A chain of depth families, with a graph at each level."""
+    data = Tree(factory=default_family_data)
+    node = data.create_from_path(tuple('f{0}'.format(i) for i in range(depth)))
+    for parent in [node] + list(node.iter_all_parents()):
+        parent.data.alias = parent.path[-1] if parent.path else ''
+        graph_data = default_graph_data()
+        graph_data.update({'title': 'level {0}'.format(len(parent.path)), 'index': {'#deep'}})
+        parent.data.graphs.append(graph_data)
+    return data
+
+
+def test_deep_tree_is_compiled_and_loaded(tmp_path):
+    data = deep_tree(500)
+    index = SearchIndex(data)
+    compiled_file = str(tmp_path / 'deep.snapshot')
+
+    export_compiled(data, ['#deep'], index, TagCompleter(['#deep']), CONF, compiled_file)
+    assert os.listdir(str(tmp_path)) == ['deep.snapshot']
+
+    loaded, tags, loaded_index, completer = load_compiled(compiled_file, CONF)
+    assert ([(p, [g.title for g in n.data.graphs]) for p, n in loaded.iter_all_nodes()]
+            == [(p, [g.title for g in n.data.graphs]) for p, n in data.iter_all_nodes()])
+
+    leaf = loaded.get_from_path(tuple('f{0}'.format(i) for i in range(500)))
+    assert len(list(leaf.iter_all_parents())) == 500
+    assert loaded.create_from_path(('f0', 'f1')) is loaded.get_from_path(('f0',)).sons['f1']
+
+    query = build_query('#deep level')
+    assert loaded_index.search(query) == index.search(query)
+    assert completer.complete('de') == ['#deep']
+
+
+def test_failed_compile_leaves_no_file(tmp_path):
+    data = deep_tree(3)
+    compiled_file = str(tmp_path / 'failed.snapshot')
+
+    with pytest.raises(Exception):
+        # Functions cannot be pickled
+        export_compiled(data, [], SearchIndex(data), lambda: None, CONF, compiled_file)
+    assert os.listdir(str(tmp_path)) == []
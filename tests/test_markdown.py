@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from graphdash.defaults import default_family_data, default_graph_data
+from graphdash.load import prewarm_markdown
+from graphdash.markdown_filter import md_convert
+from graphdash.struct.tree import Tree
+
+
+def test_non_string_texts_are_skipped_when_prewarming(capsys):
+    data = Tree(factory=default_family_data)
+    data.create_from_path(('year',)).data.text = 2019
+    node = data.create_from_path(('date',))
+    node.data.text = datetime.date(2019, 1, 1)
+    graph_data = default_graph_data()
+    graph_data.text = ['a', 'list']
+    node.data.graphs.append(graph_data)
+
+    prewarm_markdown(data, ['*header*', None])
+    # Header, root text, and graph title and pretext
+    assert '( ) 4 texts rendered' in capsys.readouterr().out
+
+
+def test_non_string_texts_are_rendered():
+    assert md_convert(2019) == '<p>2019</p>'
+    assert md_convert(datetime.date(2019, 1, 1)) == '<p>2019-01-01</p>'
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import os.path as op
+import subprocess
+import sys
+
+import pytest
+
+from graphdash.metrics import Metrics
+
+
+def dead_pid():
+    """Pid of a process which exited."""
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def test_files_of_exited_processes_are_removed(tmp_path):
+    directory = str(tmp_path)
+    stale = op.join(directory, 'metrics_{0}.json'.format(dead_pid()))
+    running = op.join(directory, 'metrics_{0}.json'.format(os.getppid()))
+    for path in stale, stale + '.tmp', running:
+        with open(path, 'w') as f:
+            json.dump({'counters': [['c', [], 1]], 'histograms': []}, f)
+
+    metrics = Metrics(directory, interval=60).start()
+    assert sorted(os.listdir(directory)) == [op.basename(running)]
+
+    metrics.inc('c')
+    assert 'c 2.0' in metrics.expose()
+    assert op.isfile(op.join(directory, 'metrics_{0}.json'.format(os.getpid())))
+
+    metrics.stop()
+    assert os.listdir(directory) == [op.basename(running)]
+
+    metrics.flush()
+    assert os.listdir(directory) == [op.basename(running)]
+
+
+def misses_total(exposed, cache):
+    line = 'graphdash_cache_misses_total{{cache="{0}"}} '.format(cache)
+    return sum(float(e[len(line):]) for e in exposed.splitlines() if e.startswith(line))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_workers_count_their_own_cache_misses(tmp_path):
+    from graphdash.markdown_filter import md_convert
+    from graphdash.routes import cache_counters, reset_cache_counters
+
+    metrics = Metrics(str(tmp_path), interval=60).start()
+    metrics.add_collector(cache_counters)
+
+    # Misses before forking, as when prewarming
+    md_convert('*before* {0}'.format(tmp_path))
+    md_convert('*before again* {0}'.format(tmp_path))
+    metrics.inc('c')
+    misses = misses_total(metrics.expose(), 'markdown')
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # What at_fork hooks do in workers
+            reset_cache_counters()
+            metrics.start()
+            md_convert('*after* {0}'.format(tmp_path))
+            metrics.inc('c')
+            metrics.flush()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    # The parent, and a worker with one miss of its own
+    assert misses_total(metrics.expose(), 'markdown') == misses + 1
+    metrics.stop()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from graphdash.defaults import default_family_data, default_graph_data, default_label_data
+from graphdash.load import propagate_labels
+from graphdash.struct.tree import Tree
+
+
+def propagate_labels_nested(data):
+    """Labels propagation, walking sub-families and parents of
+    each family as before masks."""
+    for _, node in data.iter_all_nodes():
+        # Down
+        for _, child in node.iter_all_nodes():
+            child.data.labels |= node.data.labels
+            for graph_data in child.data.graphs:
+                graph_data.labels |= node.data.labels
+                for label in graph_data.labels:
+                    graph_data.index.add(label.name)
+
+        # Up
+        for parent in node.iter_all_parents():
+            parent.data.labels |= node.data.labels
+
+        for graph_data in node.data.graphs:
+            node.data.labels |= graph_data.labels
+            for parent in node.iter_all_parents():
+                parent.data.labels |= graph_data.labels
+            for label in graph_data.labels:
+                graph_data.index.add(label.name)
+
+
+def random_labelled_tree(seed):
+    """Tree of random families and graphs, labelled from a pool of labels,
+    with equal but distinct label objects too."""
+    rng = random.Random(seed)
+    pool = []
+    for i in range(rng.randint(1, 70)):
+        label = default_label_data()
+        label.update({'name': '#l{0}'.format(i), 'text': 'L{0}'.format(i)})
+        pool.append(label)
+
+    def random_labels():
+        return set(rng.choice(pool).copy() if rng.random() < 0.3 else rng.choice(pool)
+                   for _ in range(rng.randint(0, 3)))
+
+    data = Tree(factory=default_family_data)
+    paths = [()]
+    for _ in range(rng.randint(1, 60)):
+        path = rng.choice(paths) + ('f{0}'.format(rng.randint(0, 4)),)
+        data.create_from_path(path)
+        paths.append(path)
+
+    for path in paths:
+        node = data.get_from_path(path)
+        node.data.labels = random_labels() if rng.random() < 0.5 else set()
+        for _ in range(rng.randint(0, 4) if rng.random() < 0.6 else 0):
+            graph_data = default_graph_data()
+            graph_data.labels = random_labels()
+            graph_data.index = set('#k{0}'.format(rng.randint(0, 5))
+                                   for _ in range(rng.randint(0, 3)))
+            node.data.graphs.append(graph_data)
+
+    return data
+
+
+def labels_state(data):
+    return [(path, node.data.labels,
+             [(graph_data.labels, graph_data.index) for graph_data in node.data.graphs])
+            for path, node in sorted(data.iter_all_nodes(), key=lambda item: item[0])]
+
+
+def test_propagate_labels_as_nested_walks():
+    for seed in range(500):
+        expected, data = random_labelled_tree(seed), random_labelled_tree(seed)
+        propagate_labels_nested(expected)
+        propagate_labels(data)
+        assert labels_state(data) == labels_state(expected), seed
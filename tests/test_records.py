@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+import pytest
+
+from graphdash.defaults import default_label_data
+
+
+@pytest.mark.parametrize('how', ['item', 'attribute', 'update'])
+def test_label_hash_follows_changes(how):
+    label = default_label_data()
+    labels = {label}
+
+    if how == 'item':
+        label['name'] = 'new'
+    elif how == 'attribute':
+        label.name = 'new'
+    else:
+        label.update({'name': 'new'})
+
+    assert hash(label) == hash(frozenset(label.items()))
+    assert label not in labels
+    assert label in set(list(labels))
+
+
+def test_label_hash_is_not_pickled():
+    label = default_label_data()
+    hash(label)
+    loaded = pickle.loads(pickle.dumps(label))
+    loaded.color = 'red'
+    assert hash(loaded) == hash(frozenset(loaded.items()))
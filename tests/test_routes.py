@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from graphdash import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def get_json(client, path, **args):
+    response = client.get(path, query_string=args)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 5, 100])
+def test_pages_follow_next_offset(client, limit):
+    everything = get_json(client, '/search', value='')
+    nb_matches = everything['nb_matches']
+
+    offset, seen, nb_pages = 0, 0, 0
+    while offset is not None:
+        page = get_json(client, '/search', value='', offset=offset, limit=limit)
+        assert page['nb_page'] <= limit
+        seen += page['nb_page']
+        nb_pages += 1
+        assert nb_pages <= nb_matches
+        offset = page['next_offset']
+
+    assert seen == nb_matches
+
+
+def test_next_offset_does_not_depend_on_rendered_graphs(client):
+    page = get_json(client, '/search', value='', offset=0, limit=2)
+    assert page['next_offset'] == 2
+
+
+@pytest.mark.parametrize('limit', ['0', '-1'])
+def test_non_positive_limit(client, limit):
+    assert client.get('/search', query_string={'value': '', 'limit': limit}).status_code == 400
+
+
+def test_completions_are_limited(client, monkeypatch):
+    import graphdash.routes as routes
+
+    nb_tags = len(get_json(client, '/tags')['tags'])
+    assert nb_tags > routes.COMPLETE_LIMIT
+    assert len(get_json(client, '/tags/complete')['tags']) == routes.COMPLETE_LIMIT
+    assert len(get_json(client, '/tags/complete', limit=nb_tags)['tags']) == nb_tags
+
+    monkeypatch.setattr(routes, 'COMPLETE_MAX_LIMIT', 3)
+    assert len(get_json(client, '/tags/complete', limit=nb_tags)['tags']) == 3
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from graphdash.routes import build_query, split_value
+from graphdash.search import SearchIndex
+
+from conftest import random_tree
+
+# Negations, #keywords, free text, quoting and pipes
+QUERIES = [
+    '', 'alpha', '#alpha', '-#alpha', 'al', 'a', '-a', 'x/y', 'dé', 'a0/b',
+    '"alpha beta"', '#alpha #beta', '#alpha -#beta', '#alpha | beta',
+    'alpha | #beta', '-#alpha | #beta', 'beta | -#alpha', 'a | b | c',
+    '#cpu load | -#mu', 'load | load', '"x | y"', '#Gamma | al -de',
+    '-cpu | -#load', '| gamma', '#nonexistent | alpha', 'mu | #nonexistent',
+]
+
+
+def is_in_any(w, fields):
+    return any(w in field for field in fields)
+
+
+def scan(index, query):
+    """Ids of graphs matching query, checking every graph as before indexing."""
+    gids = []
+    for gid in range(len(index)):
+        family_path, family_alias, title, keywords = fields = index.graph(gid).fields
+        if (keywords.issuperset(query.keywords.include)
+                and keywords.isdisjoint(query.keywords.exclude)
+                and all(is_in_any(w, fields) for w in query.freetext.include)
+                and not any(is_in_any(w, fields) for w in query.freetext.exclude)):
+            gids.append(gid)
+    return gids
+
+
+@pytest.fixture(params=['bitsets', 'sets'])
+def index(request, rng):
+    index = SearchIndex(random_tree(rng))
+    if request.param == 'sets':
+        index._bitsets = None
+    elif index._bitsets is None:
+        pytest.skip('NumPy is not installed')
+    return index
+
+
+@pytest.mark.parametrize('value', QUERIES)
+def test_piped_search_as_two_queries(index, value):
+    """The outer query evaluated once gives the same results as the
+    combined and outer queries evaluated apart."""
+    inner_value, outer_value = split_value(value)
+    query = build_query(inner_value + ' ' + outer_value)
+    outer = build_query(outer_value) if outer_value else None
+
+    expected_gids = scan(index, query)
+    expected_total = len(scan(index, outer)) if outer is not None else len(index)
+
+    assert index.search(query, outer) == (expected_gids, expected_total)
+    assert index.count(query, outer) == (len(expected_gids), expected_total)
+
+
+@pytest.mark.parametrize('value', [v for v in QUERIES if '|' not in v])
+def test_scores_do_not_depend_on_scoring_order(index, value):
+    query = build_query(value)
+    score = index._scorer(query)
+    for gid in index.search(query)[0]:
+        assert score(gid) == index._scorer(query)(gid)
+
+
+def test_families_differing_by_case_are_scored_apart():
+    from graphdash.defaults import default_family_data, default_graph_data
+    from graphdash.struct.tree import Tree
+
+    data = Tree(factory=default_family_data)
+    for family, alias in ('X', 'xx'), ('x', 'bar'):
+        node = data.create_from_path((family,))
+        node.data.alias = alias
+        graph_data = default_graph_data()
+        graph_data.title = 'title'
+        node.data.graphs.append(graph_data)
+
+    index = SearchIndex(data)
+    query = build_query('x')
+    ranked, _, _ = index.search_ranked(query, 2)
+
+    assert [index.graph(gid).family_path for gid, _ in ranked] == ['X', 'x']
+    assert ranked[0][1] > ranked[1][1]
+    for gid, score in ranked:
+        assert score == index._scorer(query)(gid)